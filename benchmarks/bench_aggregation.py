@@ -0,0 +1,134 @@
+"""
+Micro-benchmark for price-level aggregation
+
+Compares the per-trade cost of the original aggregation loop (pydantic
+Trade input, timezone parsed and last_trade_time formatted for every trade)
+with the current pure-Python and NumPy implementations, which read a
+TradeBatch. Also reports memory per trade for List[Trade] vs TradeBatch.
+
+Usage:
+    python benchmarks/bench_aggregation.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import volume_wall_detector as vwd
+from volume_wall_detector import OrderBook, OrderBookLevel, PriceVolumeData, Trade, TradeBatch
+
+ORDER_BOOK = OrderBook(
+    symbol="BENCH",
+    timestamp=datetime.now().isoformat(),
+    match_price=41.0,
+    bid_1=OrderBookLevel(price=40.95, volume=1000),
+    ask_1=OrderBookLevel(price=41.0, volume=1000),
+    change_percent=0.0,
+    volume=0
+)
+
+def synthetic_trades(count: int, seed: int = 7) -> List[Trade]:
+    """Newest-first trades spread over 40 price ticks, three trades per second"""
+    rnd = random.Random(seed)
+    start = int(time.time())
+    sides = ("bu", "sd", "after-hour")
+    return [
+        Trade.model_construct(
+            trade_id=str(i),
+            symbol="BENCH",
+            price=round(40 + rnd.randint(0, 40) * 0.05, 2),
+            volume=rnd.randint(1, 50) * 100,
+            side=sides[rnd.randrange(3)],
+            time=start - i // 3
+        )
+        for i in range(count)
+    ]
+
+def legacy_analyze_volume_at_price(trades: List[Trade], order_book: OrderBook) -> Dict[float, PriceVolumeData]:
+    """The aggregation loop as it was before timezone caching, kept for comparison"""
+    price_volumes: Dict[float, PriceVolumeData] = {}
+    for trade in reversed(trades):
+        price = trade.price
+        if price not in price_volumes:
+            price_volumes[price] = PriceVolumeData()
+        data = price_volumes[price]
+        if trade.side == "bu":
+            data.buy_volume += trade.volume
+            data.buy_value += trade.value
+        elif trade.side == "sd":
+            data.sell_volume += trade.volume
+            data.sell_value += trade.value
+        elif price >= order_book.ask_1.price:
+            data.after_hour_buy += trade.volume
+            data.after_hour_buy_value += trade.value
+        elif price <= order_book.bid_1.price:
+            data.after_hour_sell += trade.volume
+            data.after_hour_sell_value += trade.value
+        else:
+            data.after_hour_unknown += trade.volume
+            data.after_hour_unknown_value += trade.value
+        tz = vwd.parse_timezone(vwd.TIMEZONE)
+        data.total_trades += 1
+        data.last_trade_time = str(datetime.fromtimestamp(trade.time, tz=tz))
+    return vwd._finalize_levels(price_volumes)
+
+def batch_engine(aggregate: Callable) -> Callable:
+    """Adapt a per-batch aggregation engine to (trades, order_book) -> levels"""
+    def run(trades: TradeBatch, order_book: OrderBook) -> Dict[float, PriceVolumeData]:
+        counters = aggregate(trades, order_book.bid_1.price, order_book.ask_1.price)
+        return vwd._levels_from_counters(*counters[:5])
+    return run
+
+def time_per_trade(func: Callable, trades, repeat: int) -> float:
+    """Best-of-`repeat` wall time per trade, in nanoseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(trades, ORDER_BOOK)
+        best = min(best, time.perf_counter() - start)
+    return best / max(len(trades), 1) * 1e9
+
+def bytes_per_trade(build: Callable[[], object], count: int) -> float:
+    """Traced allocation per trade for the object returned by `build`"""
+    tracemalloc.start()
+    kept = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size / max(count, 1)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # (name, function, takes a TradeBatch)
+    implementations = [
+        ("before", legacy_analyze_volume_at_price, False),
+        ("python", batch_engine(vwd._aggregate_batch_python), True)
+    ]
+    if vwd.np is not None:
+        implementations.append(("numpy", batch_engine(vwd._aggregate_batch_numpy), True))
+
+    print(f"{'trades':>10}" + "".join(f"{name + ' ns/trade':>20}" for name, _, _ in implementations))
+    for size in args.sizes:
+        trades = synthetic_trades(size)
+        batch = TradeBatch.from_trades(trades)
+        row = [time_per_trade(func, batch if columnar else trades, args.repeat) for _, func, columnar in implementations]
+        print(f"{size:>10}" + "".join(f"{ns:>20.1f}" for ns in row))
+
+    size = min(args.sizes)
+    docs = TradeBatch.from_trades(synthetic_trades(size)).to_docs()
+    model_bytes = bytes_per_trade(lambda: [Trade(**doc) for doc in docs], size)
+    batch_bytes = bytes_per_trade(lambda: TradeBatch.from_docs("BENCH", docs), size)
+    print(f"\nmemory per trade at {size} trades: List[Trade] {model_bytes:.0f} B, TradeBatch {batch_bytes:.0f} B")
+
+if __name__ == "__main__":
+    main()
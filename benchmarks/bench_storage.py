@@ -0,0 +1,126 @@
+"""
+Latency comparison of the storage backends
+
+Runs the same workload against each backend through store_stock_data and
+analyze_stock_data: ingestion polls of one order book plus one page of
+new trades, a replayed page that is all duplicates, then repeated
+python-backend analyses with the result cache disabled.
+
+MongoDB is only included with --mongo, against the server configured in
+the environment (MONGO_HOST, MONGO_DATABASE, ...). Use a scratch
+database: the benchmark symbol's documents are deleted first.
+
+Usage:
+    python benchmarks/bench_storage.py [--trades 100000] [--backends memory sqlite] [--mongo]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import volume_wall_detector as vwd
+from volume_wall_detector import OrderBook, OrderBookLevel, TradeBatch
+
+SYMBOL = "BENCH"
+
+def synthetic_pages(count: int, page_size: int, seed: int = 7) -> List[TradeBatch]:
+    """Polls' worth of newest-first trade pages, oldest page first, three trades per second"""
+    rnd = random.Random(seed)
+    start = time.time() - count / 3
+    sides = (vwd.SIDE_BUY, vwd.SIDE_SELL, vwd.SIDE_AFTER_HOUR)
+    pages = []
+    for first in range(0, count, page_size):
+        page = TradeBatch(SYMBOL)
+        for i in reversed(range(first, min(first + page_size, count))):
+            page.append(
+                str(i),
+                round(40 + rnd.randint(0, 40) * 0.05, 2),
+                rnd.randint(1, 50) * 100,
+                sides[rnd.randrange(3)],
+                start + i / 3
+            )
+        pages.append(page)
+    return pages
+
+def order_book() -> OrderBook:
+    return OrderBook(
+        symbol=SYMBOL,
+        timestamp=datetime.now().isoformat(),
+        match_price=41.0,
+        bid_1=OrderBookLevel(price=40.95, volume=1000),
+        ask_1=OrderBookLevel(price=41.0, volume=1000),
+        change_percent=0.0,
+        volume=0
+    )
+
+def timed(func: Callable, *args) -> float:
+    """Wall time of one call, in milliseconds"""
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1e3
+
+def percentiles(samples: List[float]) -> str:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return f"p50 {cuts[49]:8.3f}  p95 {cuts[94]:8.3f}  max {max(samples):8.3f} ms"
+
+def run(storage: vwd.StorageBackend, pages: List[TradeBatch], analyses: int) -> Dict[str, List[float]]:
+    vwd.set_storage(storage)
+    samples: Dict[str, List[float]] = {"order book": [], "trade page": [], "duplicate page": [], "analysis": []}
+
+    started = time.perf_counter()
+    for page in pages:
+        samples["order book"].append(timed(vwd.store_stock_data, order_book(), "order_books"))
+        samples["trade page"].append(timed(vwd.store_stock_data, page, "trades"))
+    ingest_seconds = time.perf_counter() - started
+
+    for page in pages[-min(len(pages), 100):]:
+        samples["duplicate page"].append(timed(vwd.store_stock_data, page, "trades"))
+    for _ in range(analyses):
+        samples["analysis"].append(timed(vwd.analyze_stock_data, SYMBOL))
+
+    trades = sum(len(page) for page in pages)
+    print(f"\n{storage.name}: {trades} trades ingested at {trades / ingest_seconds:,.0f} trades/s")
+    for name, values in samples.items():
+        print(f"  {name:>15}  {percentiles(values)}")
+    return samples
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--trades", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=vwd.PAGE_SIZE)
+    parser.add_argument("--analyses", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite"])
+    parser.add_argument("--mongo", action="store_true", help="also benchmark the configured MongoDB")
+    args = parser.parse_args()
+
+    # Measure storage, not the cache; analyze the same trades on every backend
+    vwd._analysis_cache.ttl = 0
+    vwd.TRADES_TO_FETCH = args.trades
+    pages = synthetic_pages(args.trades, args.page_size)
+    print(f"{len(pages)} polls of {args.page_size} trades, analysis over the newest {args.trades} trades")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends:
+            if name == "sqlite":
+                storage = vwd.SQLiteStorage(os.path.join(directory, "bench.db"))
+            else:
+                storage = vwd.MemoryStorage()
+            run(storage, pages, args.analyses)
+            storage.close()
+
+    if args.mongo:
+        db = vwd.get_database()
+        for collection_name in ("trades", "order_books", "volume_profiles"):
+            db[collection_name].delete_many({"symbol": SYMBOL})
+        db[vwd.ORDER_BOOK_HISTORY].delete_many({"s": SYMBOL})
+        run(vwd.MongoStorage(), pages, args.analyses)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+End-to-end benchmark suite with JSON output
+
+Runs the detector against the local fake market-data API (fake_api.py)
+and an in-process store, with no API_BASE_URL or MongoDB needed:
+
+- ingestion: fetch_and_store_stock_data per symbol (and the async
+  fetch_and_store_many when aiohttp is installed), in trades per second;
+- analysis: analyze_stock_data latency over 1k/10k/100k/1M stored trades;
+- memory: tracemalloc high-water mark of each stage, measured in a
+  separate pass so it does not skew the timings, plus the process max RSS.
+
+The default store is MemoryStorage, the in-process stand-in for MongoDB;
+--storage sqlite or mongo (the server from the environment; the BENCH*
+symbols are deleted first) run the same workload on the others.
+
+Usage:
+    python benchmarks/bench_suite.py [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import volume_wall_detector as vwd
+from volume_wall_detector import OrderBook, OrderBookLevel, TradeBatch
+from fake_api import FakeAPIServer, synthetic_trades
+
+SCHEMA_VERSION = 1
+
+def make_storage(kind: str, directory: str) -> vwd.StorageBackend:
+    """A fresh, empty store of the requested kind"""
+    if kind == "memory":
+        return vwd.MemoryStorage()
+    if kind == "sqlite":
+        path = os.path.join(directory, f"bench-{time.perf_counter_ns()}.db")
+        return vwd.SQLiteStorage(path)
+    db = vwd.get_database()
+    for collection_name in ("trades", "order_books", "volume_profiles"):
+        db[collection_name].delete_many({"symbol": {"$regex": "^BENCH"}})
+    db[vwd.ORDER_BOOK_HISTORY].delete_many({"s": {"$regex": "^BENCH"}})
+    return vwd.MongoStorage()
+
+def peak_memory(func: Callable[[], Any]) -> int:
+    """tracemalloc high-water mark of one call, in bytes"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def ingest(mode: str, symbols: List[str]) -> None:
+    if mode == "async":
+        results = vwd.fetch_and_store_many(symbols)
+    else:
+        results = {symbol: vwd.fetch_and_store_stock_data(symbol) for symbol in symbols}
+    for symbol, result in results.items():
+        if not result.trades.success or result.trades.error:
+            raise RuntimeError(f"Ingestion failed for {symbol}: {result.trades.error}")
+
+def bench_ingestion(args: argparse.Namespace, directory: str) -> List[Dict[str, Any]]:
+    """Fetch and store every symbol's trades from an empty store"""
+    modes = ["sync"] + (["async"] if vwd.aiohttp is not None else [])
+    symbols = [f"BENCH{i}" for i in range(args.symbols)]
+    vwd.TRADES_TO_FETCH = args.ingest_trades
+    results = []
+    with FakeAPIServer(args.ingest_trades, args.latency, args.server_page_size) as server:
+        vwd.API_BASE_URL = server.url
+        for mode in modes:
+            vwd.set_storage(make_storage(args.storage, directory))
+            requests_before, bytes_before = server.requests, server.bytes_sent
+            started = time.perf_counter()
+            ingest(mode, symbols)
+            elapsed = time.perf_counter() - started
+            trades = args.symbols * args.ingest_trades
+            entry = {
+                "mode": mode,
+                "symbols": args.symbols,
+                "trades": trades,
+                "seconds": elapsed,
+                "trades_per_second": trades / elapsed,
+                "requests": server.requests - requests_before,
+                "bytes_received": server.bytes_sent - bytes_before
+            }
+            if not args.skip_memory:
+                vwd.set_storage(make_storage(args.storage, directory))
+                entry["peak_memory_bytes"] = peak_memory(lambda: ingest(mode, symbols))
+            results.append(entry)
+            print(f"ingest {mode:>5}: {trades} trades in {elapsed:.2f}s ({entry['trades_per_second']:,.0f} trades/s)", file=sys.stderr)
+    return results
+
+def load_trades(symbol: str, count: int) -> None:
+    """Store `count` synthetic trades and an order book for `symbol`, bypassing the API"""
+    storage = vwd.get_storage()
+    batch = TradeBatch(symbol)
+    for row in synthetic_trades(symbol, count, time.time()):
+        batch.append(*row)
+        if len(batch) == 50_000:
+            storage.store_trades(batch)
+            batch = TradeBatch(symbol)
+    if batch:
+        storage.store_trades(batch)
+    storage.store_order_book(OrderBook(
+        symbol=symbol,
+        timestamp=datetime.now().isoformat(),
+        match_price=41.0,
+        bid_1=OrderBookLevel(price=40.95, volume=1000),
+        ask_1=OrderBookLevel(price=41.0, volume=1000),
+        change_percent=0.0,
+        volume=0
+    ))
+
+def bench_analysis(args: argparse.Namespace, directory: str) -> List[Dict[str, Any]]:
+    """analyze_stock_data latency over stored trades of increasing size"""
+    vwd.set_storage(make_storage(args.storage, directory))
+    vwd._analysis_cache.ttl = 0  # Measure the analysis, not the cache
+    results = []
+    for size in args.sizes:
+        symbol = f"BENCH{size}"
+        load_trades(symbol, size)
+        vwd.TRADES_TO_FETCH = size
+
+        def analyze() -> dict:
+            return vwd.analyze_stock_data(symbol, days=2, backend=args.analysis_backend)
+
+        analyze()  # Warm up
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            analyze()
+            samples.append((time.perf_counter() - started) * 1e3)
+        entry = {
+            "trades": size,
+            "backend": args.analysis_backend,
+            "min_ms": min(samples),
+            "median_ms": statistics.median(samples),
+            "max_ms": max(samples),
+            "ms_per_1k_trades": statistics.median(samples) * 1000 / size
+        }
+        if not args.skip_memory:
+            entry["peak_memory_bytes"] = peak_memory(analyze)
+        results.append(entry)
+        print(f"analyze {size:>8} trades: median {entry['median_ms']:.1f} ms", file=sys.stderr)
+    return results
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print each metric's change against a baseline run"""
+    def index(entries: List[Dict[str, Any]], key: str) -> Dict[Any, Dict[str, Any]]:
+        return {entry[key]: entry for entry in entries}
+
+    checks = (
+        ("ingestion", "mode", ("trades_per_second", "peak_memory_bytes")),
+        ("analysis", "trades", ("median_ms", "peak_memory_bytes"))
+    )
+    for section, key, metrics in checks:
+        before = index(baseline.get(section, []), key)
+        for entry in current.get(section, []):
+            old = before.get(entry[key])
+            if old is None:
+                continue
+            for metric in metrics:
+                if metric in entry and old.get(metric):
+                    change = (entry[metric] / old[metric] - 1) * 100
+                    print(f"{section} {entry[key]} {metric}: {old[metric]:,.1f} -> {entry[metric]:,.1f} ({change:+.1f}%)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--storage", choices=["memory", "sqlite", "mongo"], default="memory")
+    parser.add_argument("--symbols", type=int, default=4, help="symbols ingested per run")
+    parser.add_argument("--ingest-trades", type=int, default=10_000, help="trades served and fetched per symbol")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API latency per request, in seconds")
+    parser.add_argument("--server-page-size", type=int, default=None, help="cap on items per /le-table page")
+    parser.add_argument("--page-size", type=int, default=vwd.PAGE_SIZE, help="pageSize requested by the client")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--analysis-backend", default="python", choices=sorted(vwd.ANALYSIS_BACKENDS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-memory", action="store_true", help="skip the tracemalloc passes")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    # The fake API needs no pacing; the client still pays for its token bucket
+    vwd._rate_limiter = vwd.TokenBucket(1e9, 1_000_000)
+    vwd.PAGE_SIZE = args.page_size
+
+    with tempfile.TemporaryDirectory() as directory:
+        results: Dict[str, Any] = {
+            "schema_version": SCHEMA_VERSION,
+            "meta": {
+                "started_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": vwd.np is not None,
+                "storage": args.storage,
+                "latency_seconds": args.latency,
+                "page_size": args.page_size,
+                "server_page_size": args.server_page_size
+            },
+            "ingestion": bench_ingestion(args, directory),
+            "analysis": bench_analysis(args, directory)
+        }
+        vwd.get_storage().close()
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark for /le-table trade time conversion
+
+Compares the per-page cost of the original conversion (strptime plus
+datetime.combine with date.today() for every item) with SessionClock,
+which resolves the trading day once per fetch and converts "HH:MM:SS"
+through the parse_clock memo table.
+
+Usage:
+    python benchmarks/bench_timestamps.py [--page-size 50] [--pages 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import volume_wall_detector as vwd
+
+def synthetic_pages(pages: int, page_size: int, seed: int = 7) -> List[List[str]]:
+    """Newest-first "HH:MM:SS" pages from a trading session, three trades per second"""
+    rnd = random.Random(seed)
+    clock = 14 * 3600 + 45 * 60
+    result = []
+    for _ in range(pages):
+        page = []
+        for _ in range(page_size):
+            clock = max(clock - rnd.randrange(2), 9 * 3600)
+            page.append(f"{clock // 3600:02d}:{clock // 60 % 60:02d}:{clock % 60:02d}")
+        result.append(page)
+    return result
+
+def legacy_convert(pages: List[List[str]]) -> None:
+    """The conversion as it was before SessionClock"""
+    for page in pages:
+        for clock in page:
+            datetime.combine(date.today(), datetime.strptime(clock, "%H:%M:%S").time()).timestamp()
+
+def session_clock_convert(pages: List[List[str]]) -> None:
+    """One SessionClock per fetch, as fetch_trades does"""
+    clock = vwd.SessionClock()
+    for page in pages:
+        for item in page:
+            clock.epoch(item)
+
+def time_per_page(func: Callable, pages: List[List[str]], repeat: int) -> float:
+    """Best-of-`repeat` wall time per page, in microseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(pages)
+        best = min(best, time.perf_counter() - start)
+    return best / max(len(pages), 1) * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=vwd.PAGE_SIZE)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages, args.page_size)
+    before = time_per_page(legacy_convert, pages, args.repeat)
+    vwd._clock_seconds.clear()
+    cold = time_per_page(session_clock_convert, pages, 1)
+    warm = time_per_page(session_clock_convert, pages, args.repeat)
+
+    print(f"{args.page_size} trades per page, {args.pages} pages")
+    print(f"{'before':>16}{before:>12.1f} us/page")
+    print(f"{'session (cold)':>16}{cold:>12.1f} us/page")
+    print(f"{'session (warm)':>16}{warm:>12.1f} us/page")
+    print(f"{'speedup (warm)':>16}{before / warm:>12.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Local stand-in for the market-data API
+
+Serves /v2/stock/{symbol} and /le-table (lastId pagination) from synthetic
+trades over HTTP, with configurable per-request latency and a server-side
+page size cap, so the ingestion pipeline can be benchmarked end to end
+without API_BASE_URL.
+
+Usage:
+    python benchmarks/fake_api.py [--port 8765] [--trades 10000] [--latency 0.02]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import volume_wall_detector as vwd
+
+SIDES = ("bu", "sd", None)
+
+def trades_per_second(count: int) -> int:
+    """Trade rate that fits `count` trades into the last ~22 hours"""
+    return max(3, math.ceil(count / 80_000))
+
+def synthetic_trades(symbol: str, count: int, end_time: float, seed: int = 7) -> Iterator[Tuple[str, float, int, int, float]]:
+    """
+    Newest-first (trade_id, price, volume, side code, epoch) rows
+
+    Prices spread over 40 ticks around 41.0 and trades arrive at
+    trades_per_second(count), ending at `end_time`.
+    """
+    rnd = random.Random(f"{seed}:{symbol}")
+    rate = trades_per_second(count)
+    for i in range(count):
+        yield (
+            f"{symbol}-{count - i:09d}",
+            round(40 + rnd.randint(0, 40) * 0.05, 2),
+            rnd.randint(1, 50) * 100,
+            rnd.randrange(3),
+            math.floor(end_time) - i // rate
+        )
+
+def order_book_payload(match_price: float = 41.0, levels: int = 3) -> Dict[str, Any]:
+    """A /v2/stock payload with `levels` bid and ask levels one tick apart"""
+    payload: Dict[str, Any] = {"mp": match_price, "lpcp": 0.0, "lv": 0}
+    for level in range(1, levels + 1):
+        payload[f"b{level}"] = round(match_price - 0.05 * level, 2)
+        payload[f"b{level}v"] = 1000 * level
+        payload[f"o{level}"] = round(match_price + 0.05 * (level - 1), 2)
+        payload[f"o{level}v"] = 1000 * level
+    return payload
+
+class FakeMarketData:
+    """Per-symbol /le-table items, generated on first request and kept for the server's lifetime"""
+
+    def __init__(self, trades_per_symbol: int, seed: int = 7):
+        self.trades_per_symbol = trades_per_symbol
+        self.seed = seed
+        self.end_time = time.time()
+        self._items: Dict[str, List[Dict[str, Any]]] = {}
+        self._positions: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def items(self, symbol: str) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        with self._lock:
+            if symbol not in self._items:
+                items = [
+                    {
+                        "_id": trade_id,
+                        "stockSymbol": symbol,
+                        "price": price,
+                        "vol": volume,
+                        "side": SIDES[side],
+                        "time": datetime.fromtimestamp(trade_time, tz=vwd.TZINFO).strftime("%H:%M:%S")
+                    }
+                    for trade_id, price, volume, side, trade_time
+                    in synthetic_trades(symbol, self.trades_per_symbol, self.end_time, self.seed)
+                ]
+                self._items[symbol] = items
+                self._positions[symbol] = {item["_id"]: position for position, item in enumerate(items)}
+            return self._items[symbol], self._positions[symbol]
+
+    def page(self, symbol: str, page_size: int, last_id: Optional[str]) -> List[Dict[str, Any]]:
+        items, positions = self.items(symbol)
+        start = positions[last_id] + 1 if last_id in positions else 0
+        return items[start:start + page_size]
+
+class FakeAPIServer:
+    """
+    Threaded HTTP server for FakeMarketData on 127.0.0.1
+
+    Use as a context manager; `url` is the API_BASE_URL to point the
+    detector at. Every request sleeps `latency` seconds first, and pages
+    are capped at `max_page_size` items whatever pageSize asks for.
+    """
+
+    def __init__(self, trades_per_symbol: int, latency: float = 0.0, max_page_size: Optional[int] = None, port: int = 0, seed: int = 7):
+        self.data = FakeMarketData(trades_per_symbol, seed)
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+            disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+            def do_GET(self) -> None:
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path == "/le-table":
+                    page_size = int(query.get("pageSize", vwd.PAGE_SIZE))
+                    if fake.max_page_size:
+                        page_size = min(page_size, fake.max_page_size)
+                    payload = {"data": {"items": fake.data.page(query["stockSymbol"], page_size, query.get("lastId"))}}
+                elif url.path.startswith("/v2/stock/"):
+                    payload = {"data": order_book_payload()}
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with fake._lock:
+                    fake.requests += 1
+                    fake.bytes_sent += len(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeAPIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeAPIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--trades", type=int, default=10_000, help="trades served per symbol")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--max-page-size", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeAPIServer(args.trades, args.latency, args.max_page_size, args.port)
+    print(f"Serving fake market data at {server.url} (Ctrl+C to stop)")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
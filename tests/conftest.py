@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import volume_wall_detector as vwd
+
+@pytest.fixture
+def memory_storage():
+    """A fresh MemoryStorage as the process-wide backend, cache disabled"""
+    storage = vwd.MemoryStorage()
+    previous = vwd.set_storage(storage)
+    ttl, vwd._analysis_cache.ttl = vwd._analysis_cache.ttl, 0
+    yield storage
+    vwd._analysis_cache.ttl = ttl
+    vwd.set_storage(previous)
+
+@pytest.fixture
+def storage_classes():
+    """Backend classes the storage fixture builds; override to substitute subclasses"""
+    return {"memory": vwd.MemoryStorage, "sqlite": vwd.SQLiteStorage}
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path, storage_classes):
+    """Each local storage backend in turn, as the process-wide backend"""
+    storage_class = storage_classes[request.param]
+    storage = storage_class() if request.param == "memory" else storage_class(str(tmp_path / "trades.db"))
+    previous = vwd.set_storage(storage)
+    yield storage
+    # Close whatever is current: a test may have reopened the backend
+    vwd.get_storage().close()
+    vwd.set_storage(previous)
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+import volume_wall_detector as vwd
+from volume_wall_detector import OrderBook, OrderBookLevel, TradeBatch
+
+def order_book(symbol: str, bid: float, ask: float) -> OrderBook:
+    return OrderBook(
+        symbol=symbol,
+        timestamp=datetime.now().isoformat(),
+        match_price=bid,
+        bid_1=OrderBookLevel(price=bid, volume=100),
+        ask_1=OrderBookLevel(price=ask, volume=100),
+        change_percent=0.0,
+        volume=0
+    )
+
+@pytest.fixture(params=["numpy", "python"])
+def aggregator(request, monkeypatch):
+    if request.param == "numpy":
+        if vwd.np is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(vwd, "np", None)
+    return request.param
+
+def test_crossed_book_classifies_after_hour_trades_once(memory_storage, aggregator):
+    # With bid >= ask an after-hour trade at 41.0 satisfies both the buy
+    # (price >= ask) and sell (price <= bid) tests; it counts as a buy only
+    storage = memory_storage
+    storage.store_order_book(order_book("CROSS", bid=41.0, ask=40.95))
+    trades = TradeBatch("CROSS")
+    now = datetime.now().timestamp()
+    trades.append("2", 41.0, 1000, vwd.SIDE_AFTER_HOUR, now)
+    trades.append("1", 41.0, 1000, vwd.SIDE_AFTER_HOUR, now - 1)
+    storage.store_trades(trades)
+
+    volume = vwd.analyze_stock_data("CROSS", backend="python")["trading_summary"]["volume"]
+    assert volume["total"] == 2000
+    assert volume["after_hour"] == {"buy": 2000, "sell": 0, "unknown": 0, "total": 2000}
+    assert volume["buy_ratio"] == 1.0
+
+@pytest.mark.parametrize("values", [[5.0], [3.0, 1.0], [4.0, 1.0, 4.0, 2.0, 9.0], list(range(100, 0, -3))])
+def test_median_matches_statistics(values):
+    import statistics
+    assert vwd._median(list(values)) == statistics.median(values)
+
+def test_walls_use_raw_trade_epochs(aggregator):
+    # Levels built from the aggregators carry the raw epoch; levels built by
+    # hand only the formatted time. Both must decay walls the same way
+    now = datetime(2026, 1, 5, 14, 0).timestamp()
+    levels = {
+        10.0: (100, now - 3600),
+        10.5: (5000, now - 600),
+        11.0: (120, now),
+        11.5: (110, now - 60),
+        12.0: (4000, now)
+    }
+    raw, parsed = {}, {}
+    for price, (volume, last_time) in levels.items():
+        fields = dict(buy_volume=volume, total_volume=volume, total_value=volume * price, total_trades=1,
+                      last_trade_time=vwd.format_trade_time(last_time))
+        raw[price] = vwd.PriceVolumeData(last_time=last_time, **fields)
+        parsed[price] = vwd.PriceVolumeData(**fields)
+    assert "last_time" not in raw[10.0].model_dump()
+
+    walls = vwd.detect_volume_walls(raw, current_price=11.0, volume_multiple=3, band_width=0, half_life=600)
+    assert [wall["peak_price"] for wall in walls] == [12.0, 10.5]
+    assert walls == vwd.detect_volume_walls(parsed, current_price=11.0, volume_multiple=3, band_width=0, half_life=600)
@@ -0,0 +1,74 @@
+import pytest
+
+import volume_wall_detector as vwd
+from volume_wall_detector import AnalysisCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(vwd.time, "monotonic", clock)
+    return clock
+
+def key(symbol: str) -> tuple:
+    return (symbol, 1, 10_000, "python")
+
+def test_hit_returns_a_copy(clock):
+    cache = AnalysisCache(maxsize=4, ttl=10)
+    result = {"levels": [1, 2]}
+    cache.put(key("A"), cache.version("A"), result)
+    cached = cache.get(key("A"))
+    assert cached == result
+    cached["levels"].append(3)
+    assert cache.get(key("A")) == {"levels": [1, 2]}
+    assert cache.stats()["hits"] == 2
+
+def test_result_computed_during_an_ingest_is_not_cached(clock):
+    cache = AnalysisCache(maxsize=4, ttl=10)
+    version = cache.version("A")
+    cache.invalidate("A")  # An ingest stored new data while the analysis ran
+    cache.put(key("A"), version, {"stale": True})
+    assert cache.get(key("A")) is None
+    assert cache.stats()["size"] == 0
+
+def test_invalidate_turns_entries_into_misses(clock):
+    cache = AnalysisCache(maxsize=4, ttl=10)
+    cache.put(key("A"), cache.version("A"), {})
+    cache.put(key("B"), cache.version("B"), {})
+    cache.invalidate("A")
+    assert cache.get(key("A")) is None
+    assert cache.get(key("B")) == {}
+    stats = cache.stats()
+    assert (stats["invalidations"], stats["misses"], stats["hits"], stats["size"]) == (1, 1, 1, 1)
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnalysisCache(maxsize=4, ttl=10)
+    cache.put(key("A"), cache.version("A"), {})
+    clock.now += 9.9
+    assert cache.get(key("A")) == {}
+    clock.now += 0.1
+    assert cache.get(key("A")) is None
+    stats = cache.stats()
+    assert (stats["expirations"], stats["size"]) == (1, 0)
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = AnalysisCache(maxsize=2, ttl=10)
+    cache.put(key("A"), 0, {"symbol": "A"})
+    cache.put(key("B"), 0, {"symbol": "B"})
+    assert cache.get(key("A"))  # A is now the most recently used
+    cache.put(key("C"), 0, {"symbol": "C"})
+    assert cache.get(key("B")) is None
+    assert cache.get(key("A")) == {"symbol": "A"}
+    assert cache.get(key("C")) == {"symbol": "C"}
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled_without_ttl_or_size():
+    assert not AnalysisCache(maxsize=4, ttl=0).enabled
+    assert not AnalysisCache(maxsize=0, ttl=10).enabled
+    assert AnalysisCache(maxsize=4, ttl=10).enabled
@@ -0,0 +1,105 @@
+import sqlite3
+from datetime import datetime
+
+import volume_wall_detector as vwd
+from volume_wall_detector import OrderBook, OrderBookDepth, OrderBookLevel, PriceVolumeData
+
+LEGACY_ORDER_BOOKS = """CREATE TABLE order_books (
+    symbol TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    match_price REAL NOT NULL,
+    bid_price REAL NOT NULL,
+    bid_volume INTEGER NOT NULL,
+    ask_price REAL NOT NULL,
+    ask_volume INTEGER NOT NULL,
+    change_percent REAL NOT NULL,
+    volume INTEGER NOT NULL
+)"""
+
+def order_book(timestamp: str, depth=None) -> OrderBook:
+    return OrderBook(
+        symbol="DEPTH",
+        timestamp=timestamp,
+        match_price=41.0,
+        bid_1=OrderBookLevel(price=40.95, volume=1000),
+        ask_1=OrderBookLevel(price=41.0, volume=2000),
+        change_percent=0.5,
+        volume=10_000,
+        depth=depth
+    )
+
+def test_from_payload_skips_empty_levels():
+    depth = OrderBookDepth.from_payload({
+        "b1": 40.95, "b1v": 1000,
+        "b2": 0, "b2v": 0,
+        "b3": None, "b3v": None,
+        "b4": 40.8, "b4v": 0,
+        "o1": 41.0, "o1v": 2000.0,
+        "o2": 41.05, "o2v": None,
+        "o3": 0, "o3v": 500,
+        "o4": 41.15, "o4v": 3000
+    })
+    assert depth.levels() == {"bids": [[40.95, 1000]], "asks": [[41.0, 2000], [41.15, 3000]]}
+    assert len(depth) == 3
+    assert len(OrderBookDepth.from_payload({"mp": 41.0})) == 0
+
+def test_sqlite_migrates_and_round_trips_depth(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_ORDER_BOOKS)
+    conn.execute(
+        "INSERT INTO order_books VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ("DEPTH", "2026-01-05T09:00:00", 41.0, 40.95, 1000, 41.0, 2000, 0.5, 10_000)
+    )
+    conn.commit()
+    conn.close()
+
+    storage = vwd.SQLiteStorage(path)
+    try:
+        legacy = storage.latest_order_book("DEPTH")
+        assert legacy.depth is None
+        assert legacy.bid_1.volume == 1000
+
+        depth = OrderBookDepth.from_payload({"b1": 40.95, "b1v": 1000, "b2": 40.9, "b2v": 5000, "o1": 41.0, "o1v": 2000})
+        storage.store_order_book(order_book("2026-01-05T09:01:00", depth))
+        stored = storage.latest_order_book("DEPTH").depth
+        assert stored.to_doc() == depth.to_doc()
+        assert OrderBookDepth.from_doc(depth.to_doc()).levels() == depth.levels()
+
+        storage.store_order_book(order_book("2026-01-05T09:02:00"))
+        assert storage.latest_order_book("DEPTH").depth is None
+    finally:
+        storage.close()
+
+    # Reopening an already migrated database leaves it alone
+    vwd.SQLiteStorage(path).close()
+
+def test_resting_volume_alone_makes_a_wall():
+    now = datetime(2026, 1, 5, 10, 0).timestamp()
+    price_volumes = {
+        round(40.0 + 0.05 * i, 2): PriceVolumeData(
+            buy_volume=100, total_volume=100, total_value=4000.0, total_trades=1,
+            last_trade_time=vwd.format_trade_time(now), last_time=now
+        )
+        for i in range(9)
+    }
+    depth = OrderBookDepth.from_payload({
+        "b1": 40.2, "b1v": 100,     # Traded band, little resting
+        "b2": 40.0, "b2v": 2000,    # Traded band, wall only through resting bids
+        "b3": 39.5, "b3v": 1500,    # Never traded
+        "o1": 40.45, "o1v": 50
+    })
+
+    assert vwd.detect_volume_walls(price_volumes, 40.2, volume_multiple=3, band_width=0) == []
+    assert vwd.detect_volume_walls(price_volumes, 40.2, volume_multiple=3, band_width=0, depth=depth, depth_weight=0) == []
+
+    walls = vwd.detect_volume_walls(price_volumes, 40.2, volume_multiple=3, band_width=0, depth=depth, depth_weight=1)
+    assert [(wall["peak_price"], wall["position"]) for wall in walls] == [(40.0, "support"), (39.5, "support")]
+    traded, untraded = walls
+    assert traded["total_volume"] == 100
+    assert traded["resting_bid_volume"] == 2000
+    assert traded["volume_multiple"] == 21
+    assert traded["last_trade_time"] is not None
+    assert untraded["total_volume"] == 0
+    assert untraded["resting_bid_volume"] == 1500
+    assert untraded["last_trade_time"] is None
@@ -0,0 +1,72 @@
+import os
+from datetime import date
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import volume_wall_detector as vwd
+from volume_wall_detector import TradeBatch
+
+DAY = date(2026, 1, 5)
+
+@pytest.fixture(params=sorted(vwd.EXPORT_FORMATS))
+def exported(request, tmp_path):
+    """Ten trades written as one exported day, plus the batch they came from"""
+    trades = TradeBatch("EXP")
+    for i in range(10):
+        trades.append(f"t{9 - i}", 40.0 + i * 0.05, 100 * (i + 1), i % 3, 1_767_600_000.0 - i)
+    path = vwd.export_path("trades", "EXP", DAY, str(tmp_path), request.param)
+    os.makedirs(os.path.dirname(path))
+    writer = vwd._ColumnarWriter(path, vwd._export_schema(vwd.TRADE_EXPORT_FIELDS))
+    writer.write(vwd._trade_record_batch(trades))
+    writer.close()
+    return trades, str(tmp_path)
+
+def test_exported_batches_round_trip(exported):
+    trades, directory = exported
+    batch, = vwd.iter_exported_trade_batches("EXP", DAY, directory=directory)
+    assert len(batch) == len(trades)
+    assert batch.prices == trades.prices
+    assert batch.volumes == trades.volumes
+    assert batch.sides == trades.sides
+    assert batch.times == trades.times
+
+def test_exported_trade_ids_convert_on_access(exported):
+    trades, directory = exported
+    batch, = vwd.iter_exported_trade_batches("EXP", DAY, directory=directory)
+    assert isinstance(batch.trade_ids, vwd._ExportedTradeIds)
+    assert list(batch.trade_ids) == trades.trade_ids
+    assert batch.trade_ids[0] == "t9"
+    assert batch.trade_ids[-1] == "t0"
+    assert batch.trade_ids[2:5] == trades.trade_ids[2:5]
+    assert batch.trade_ids[::-3] == trades.trade_ids[::-3]
+    assert batch[:3].trade_ids == trades.trade_ids[:3]
+    assert batch.select([4, 1]).trade_ids == ["t5", "t8"]
+
+def test_exported_batches_accept_appends(exported):
+    trades, directory = exported
+    batch, = vwd.iter_exported_trade_batches("EXP", DAY, directory=directory)
+    batch.append("t-1", 39.95, 100, vwd.SIDE_SELL, 1_767_599_990.0)
+    assert len(batch) == len(trades) + 1
+    assert batch.trade_ids[-1] == "t-1"
+    assert list(batch.trade_ids) == trades.trade_ids + ["t-1"]
+    assert batch.to_docs()[-1]["price"] == 39.95
+
+def test_exported_batches_extend_and_are_extended(exported):
+    trades, directory = exported
+    batch, = vwd.iter_exported_trade_batches("EXP", DAY, directory=directory)
+    other, = vwd.iter_exported_trade_batches("EXP", DAY, directory=directory)
+
+    merged = TradeBatch("EXP")
+    merged.extend(batch)
+    assert merged.trade_ids == trades.trade_ids
+    assert merged.times == trades.times
+
+    batch.extend(trades[:2])
+    batch.extend(other)
+    batch.extend(batch)
+    expected = (trades.trade_ids + trades.trade_ids[:2] + trades.trade_ids) * 2
+    assert list(batch.trade_ids) == expected
+    assert len(batch) == len(batch.times) == len(expected)
+    assert batch[-3:].trade_ids == expected[-3:]
@@ -0,0 +1,128 @@
+from datetime import datetime
+
+import pytest
+
+import volume_wall_detector as vwd
+
+class FakeTradeFeed:
+    """/le-table pages over a newest-first item list, optionally failing one request"""
+    
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.items = []
+        self.clock = datetime.now(vwd.TZINFO).timestamp() - 3000
+        self.fail_at = None
+        self.requests = 0
+    
+    def add_trades(self, count: int) -> None:
+        """Prepend `count` newer trades, one second apart"""
+        first = len(self.items)
+        new = [
+            {
+                "_id": f"{self.symbol}-{first + i:06d}",
+                "stockSymbol": self.symbol,
+                "price": 40.0 + i % 10 * 0.05,
+                "vol": 100,
+                "side": "bu",
+                "time": datetime.fromtimestamp(self.clock + i, vwd.TZINFO).strftime("%H:%M:%S")
+            }
+            for i in range(count)
+        ]
+        self.items = new[::-1] + self.items
+        self.clock += count
+    
+    def api_get(self, path: str, params=None) -> dict:
+        assert path == "/le-table"
+        self.requests += 1
+        if self.requests == self.fail_at:
+            raise ConnectionError("connection reset")
+        ids = [item["_id"] for item in self.items]
+        start = ids.index(params["lastId"]) + 1 if "lastId" in params else 0
+        return {"data": {"items": self.items[start:start + params["pageSize"]]}}
+
+class FlakyStores:
+    """Makes a storage backend's Nth trade store raise"""
+    fail_at = None
+    trade_stores = 0
+    
+    def store_trades(self, trades, collection_name="trades"):
+        self.trade_stores += 1
+        if self.trade_stores == self.fail_at:
+            raise RuntimeError("disk full")
+        return super().store_trades(trades, collection_name)
+
+class FlakyMemoryStorage(FlakyStores, vwd.MemoryStorage):
+    pass
+
+class FlakySQLiteStorage(FlakyStores, vwd.SQLiteStorage):
+    pass
+
+@pytest.fixture
+def feed(monkeypatch):
+    feed = FakeTradeFeed("GAP")
+    monkeypatch.setattr(vwd, "api_get", feed.api_get)
+    monkeypatch.setattr(vwd, "PAGE_SIZE", 50)
+    monkeypatch.setattr(vwd, "TRADE_WRITE_BATCH_SIZE", 500)
+    monkeypatch.setattr(vwd, "TRADES_TO_FETCH", 10_000)
+    return feed
+
+@pytest.fixture
+def storage_classes():
+    return {"memory": FlakyMemoryStorage, "sqlite": FlakySQLiteStorage}
+
+def stored_ids(storage) -> set:
+    return {
+        trade_id
+        for batch in storage.iter_recent_trade_batches("GAP", 100_000, 0.0, 10_000)
+        for trade_id in batch.trade_ids
+    }
+
+def restart(storage):
+    """The storage as a new process would open it, without in-process state"""
+    if isinstance(storage, vwd.SQLiteStorage):
+        storage.close()
+        storage = vwd.SQLiteStorage(storage.path)
+    vwd.set_storage(storage)
+    return storage
+
+@pytest.mark.parametrize("fail_at", [1, 2, 3])
+def test_failed_store_is_refetched_after_restart(feed, storage, fail_at):
+    feed.add_trades(1000)
+    assert vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP")).success
+    
+    # 1,500 new trades arrive in three write batches; one of them fails
+    feed.add_trades(1500)
+    storage.fail_at = storage.trade_stores + fail_at
+    result = vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP"))
+    assert not result.success
+    assert "disk full" in result.error
+    
+    storage = restart(storage)
+    result = vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP"))
+    assert result.success
+    assert stored_ids(storage) == {item["_id"] for item in feed.items}
+    assert vwd.get_trade_watermark("GAP").trade_id == feed.items[0]["_id"]
+
+def test_failed_first_fetch_is_refetched_after_restart(feed, storage):
+    feed.add_trades(1500)
+    storage.fail_at = 2
+    assert not vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP")).success
+    
+    storage = restart(storage)
+    assert vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP")).success
+    assert stored_ids(storage) == {item["_id"] for item in feed.items}
+
+def test_interrupted_pagination_is_refetched_after_restart(feed, storage):
+    feed.add_trades(1000)
+    assert vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP")).success
+    
+    # The request for page 15 fails after the first 500-trade batch is stored
+    feed.add_trades(1500)
+    feed.fail_at = feed.requests + 15
+    with pytest.raises(ConnectionError):
+        vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP"))
+    assert len(stored_ids(storage)) > 1000
+    
+    storage = restart(storage)
+    assert vwd.fetch_and_store_trades("GAP", vwd.get_trade_watermark("GAP")).success
+    assert stored_ids(storage) == {item["_id"] for item in feed.items}
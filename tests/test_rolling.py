@@ -0,0 +1,78 @@
+import pytest
+
+from volume_wall_detector import RollingTradeWindows, TradeBatch, SIDE_AFTER_HOUR, SIDE_BUY, SIDE_SELL
+
+def trade_batch(*rows) -> TradeBatch:
+    """Batch of (time, price, volume, side) rows, given newest first"""
+    batch = TradeBatch("ROLL")
+    for time, price, volume, side in rows:
+        batch.append(f"{time}-{price}", price, volume, side, time)
+    return batch
+
+def trades_between(newest: int, oldest: int, price: float = 10.0, side: int = SIDE_BUY) -> TradeBatch:
+    return trade_batch(*((time, price, 100, side) for time in range(newest, oldest - 1, -1)))
+
+def test_older_page_after_newer_page():
+    # A pipelined fetch adds the newest page first, then older pages
+    paged = RollingTradeWindows("ROLL", windows=(60, 300))
+    paged.add(trades_between(1000, 980))
+    paged.add(trades_between(979, 600))
+    at_once = RollingTradeWindows("ROLL", windows=(60, 300))
+    at_once.add(trades_between(1000, 600))
+
+    snapshot = paged.snapshot()
+    assert snapshot == at_once.snapshot()
+    assert snapshot["1m"]["trades"] == 61  # 940..1000
+    assert snapshot["5m"]["trades"] == 301  # 700..1000
+    for window in paged._windows:
+        times = [trade[0] for trade in window.trades]
+        assert times == sorted(times)
+
+def test_later_poll_evicts_old_trades():
+    windows = RollingTradeWindows("ROLL", windows=(60,))
+    windows.add(trade_batch((1000, 10.0, 100, SIDE_BUY), (990, 10.5, 200, SIDE_SELL)))
+    windows.add(trade_batch((1055, 11.0, 300, SIDE_BUY)))
+    window = windows.snapshot()["1m"]
+    assert window["trades"] == 2
+    assert window["sell_volume"] == 0
+    assert window["levels"] == {10.0: 100, 11.0: 300}
+
+    windows.add(trade_batch((1200, 11.0, 50, SIDE_SELL)))
+    window = windows.snapshot()["1m"]
+    assert window["trades"] == 1
+    assert window["buy_volume"] == 0
+    assert window["total_value"] == pytest.approx(550.0)
+    assert window["levels"] == {11.0: 50}
+
+def test_snapshot_slides_past_newest_trade():
+    windows = RollingTradeWindows("ROLL", windows=(60, 300))
+    windows.add(trades_between(1000, 901))
+
+    snapshot = windows.snapshot(now=1050)
+    assert snapshot["1m"]["trades"] == 11  # 990..1000
+    assert snapshot["5m"]["trades"] == 100
+    assert windows.snapshot(now=2000)["5m"]["trades"] == 0
+    # An earlier time cannot bring evicted trades back
+    assert windows.snapshot(now=500)["1m"]["trades"] == 0
+
+def test_after_hour_volume_classified_against_latest_quote():
+    windows = RollingTradeWindows("ROLL", windows=(60,))
+    windows.add(trade_batch(
+        (1003, 11.0, 100, SIDE_AFTER_HOUR),
+        (1002, 10.5, 200, SIDE_AFTER_HOUR),
+        (1001, 10.0, 300, SIDE_AFTER_HOUR),
+        (1000, 10.5, 1000, SIDE_BUY)
+    ))
+    window = windows.snapshot()["1m"]
+    assert window["after_hour"] == {"buy": 0, "sell": 0, "unknown": 600}
+
+    windows.update_quote(bid_price=10.0, ask_price=11.0)
+    window = windows.snapshot()["1m"]
+    assert window["after_hour"] == {"buy": 100, "sell": 300, "unknown": 200}
+    assert window["buy_volume"] == 1000
+    assert window["volume_imbalance"] == 1100 - 300
+    assert window["buy_ratio"] == pytest.approx(1100 / 1400)
+
+    windows.update_quote(bid_price=10.5, ask_price=10.6)
+    window = windows.snapshot()["1m"]
+    assert window["after_hour"] == {"buy": 100, "sell": 500, "unknown": 0}
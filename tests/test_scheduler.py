@@ -0,0 +1,67 @@
+import heapq
+
+import pytest
+
+import volume_wall_detector as vwd
+from volume_wall_detector import IngestionScheduler, MongoResult, StoreResult, TradesResult
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(vwd.time, "monotonic", clock)
+    return clock
+
+def ok(symbol: str) -> StoreResult:
+    return StoreResult(order_book=MongoResult(success=True), trades=TradesResult(success=True))
+
+def tick(scheduler: IngestionScheduler, clock: Clock) -> float:
+    """Run the next due refresh inline, as run() would at its due time"""
+    due, symbol = heapq.heappop(scheduler._heap)
+    clock.now = max(clock.now, due)
+    scheduler._in_flight += 1
+    scheduler._refresh(symbol)
+    return due
+
+def test_jitter_does_not_accumulate(clock):
+    scheduler = IngestionScheduler({"VIC": 10.0}, workers=1, jitter=0.1, job=ok)
+    start = clock.now
+    dues = [tick(scheduler, clock) for _ in range(2000)]
+    
+    state = scheduler.symbols["VIC"]
+    assert state.base == pytest.approx(start + 2000 * 10.0)
+    # Every tick stays within one jitter window of its slot on the grid
+    for slot, due in enumerate(dues):
+        assert start + slot * 10.0 <= due <= start + slot * 10.0 + 1.0
+    assert (dues[-1] - dues[0]) / (len(dues) - 1) == pytest.approx(10.0, abs=1e-3)
+    assert state.coalesced_ticks == 0
+
+def test_slow_refresh_coalesces_missed_ticks(clock):
+    def slow(symbol: str) -> StoreResult:
+        clock.now += 35.0
+        return ok(symbol)
+    
+    scheduler = IngestionScheduler({"VIC": 10.0}, workers=1, jitter=0.0, job=slow)
+    start = clock.now
+    tick(scheduler, clock)
+    
+    state = scheduler.symbols["VIC"]
+    assert state.coalesced_ticks == 3  # Slots at +10, +20 and +30 were missed
+    assert state.base == start + 35.0
+    assert scheduler._heap == [(start + 35.0, "VIC")]
+    assert "base" not in scheduler.stats()["VIC"]
+
+def test_failures_are_counted(clock):
+    def failing(symbol: str) -> StoreResult:
+        raise ConnectionError("timed out")
+    
+    scheduler = IngestionScheduler({"VIC": 5.0}, workers=1, jitter=0.0, job=failing)
+    tick(scheduler, clock)
+    stats = scheduler.stats()["VIC"]
+    assert (stats["runs"], stats["failures"], stats["last_error"]) == (1, 1, "timed out")
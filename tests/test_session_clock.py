@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+
+import volume_wall_detector as vwd
+from volume_wall_detector import SessionClock, parse_clock, parse_timezone
+
+def epoch(tz: str, *fields) -> float:
+    return datetime(*fields, tzinfo=parse_timezone(tz)).timestamp()
+
+@pytest.fixture
+def gmt7(monkeypatch):
+    monkeypatch.setattr(vwd, "TZINFO", parse_timezone("GMT+7"))
+
+def test_parse_clock():
+    assert parse_clock("00:00:00") == 0
+    assert parse_clock("09:15:30") == 9 * 3600 + 15 * 60 + 30
+    assert parse_clock("23:59:59") == 86399
+
+@pytest.mark.parametrize("clock", [
+    "", "9:15:30", "09:15", "09:15:30.5", "09-15-30", "24:00:00", "09:60:00", "09:15:60",
+    "-1:00:00", "+1:00:00", " 9:15:30", "09:1a:30", "٠٩:١٥:٣٠"
+])
+def test_parse_clock_rejects_malformed_times(clock):
+    with pytest.raises(ValueError, match="Invalid trade time"):
+        parse_clock(clock)
+
+def test_epoch_rejects_malformed_times(gmt7):
+    clock = SessionClock(now=epoch("GMT+7", 2026, 1, 5, 10, 0))
+    with pytest.raises(ValueError, match="Invalid trade time"):
+        clock.epoch("10:00")
+
+def test_epoch_on_current_day(gmt7):
+    clock = SessionClock(now=epoch("GMT+7", 2026, 1, 5, 10, 0))
+    assert clock.epoch("09:15:30") == epoch("GMT+7", 2026, 1, 5, 9, 15, 30)
+    # Up to CLOCK_SKEW ahead of now is still today (the API's clock runs fast)
+    assert clock.epoch("10:05:00") == epoch("GMT+7", 2026, 1, 5, 10, 5)
+
+def test_epoch_rolls_back_to_previous_day_past_clock_skew(gmt7):
+    # Shortly after midnight the fetch pages back into yesterday's trades
+    clock = SessionClock(now=epoch("GMT+7", 2026, 1, 5, 0, 2))
+    assert clock.epoch("00:01:00") == epoch("GMT+7", 2026, 1, 5, 0, 1)
+    assert clock.epoch("00:07:00") == epoch("GMT+7", 2026, 1, 5, 0, 7)
+    assert clock.epoch("00:07:01") == epoch("GMT+7", 2026, 1, 4, 0, 7, 1)
+    assert clock.epoch("23:59:59") == epoch("GMT+7", 2026, 1, 4, 23, 59, 59)
+
+def test_epoch_uses_configured_timezone(monkeypatch):
+    monkeypatch.setattr(vwd, "TZINFO", parse_timezone("GMT-5"))
+    # 03:00 UTC on Jan 6 is still Jan 5 in GMT-5
+    now = epoch("GMT+0", 2026, 1, 6, 3, 0)
+    clock = SessionClock(now=now)
+    assert clock.day_start == epoch("GMT-5", 2026, 1, 5, 0, 0)
+    assert clock.epoch("21:30:00") == epoch("GMT-5", 2026, 1, 5, 21, 30)
+    assert clock.epoch("21:30:00") == now - 30 * 60
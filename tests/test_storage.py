@@ -0,0 +1,107 @@
+import threading
+from datetime import date
+
+import pymongo.errors
+import pytest
+
+import volume_wall_detector as vwd
+from volume_wall_detector import TradeBatch
+
+def trade_batch(symbol: str, first: int, count: int) -> TradeBatch:
+    """Newest-first trades with ids first .. first + count - 1"""
+    batch = TradeBatch(symbol)
+    for i in reversed(range(first, first + count)):
+        batch.append(f"{symbol}-{i}", 40.0 + i % 10 * 0.05, 100, i % 3, 1_700_000_000.0 + i)
+    return batch
+
+def test_concurrent_overlapping_stores_insert_each_trade_once(storage):
+    # Four writers store overlapping pages of the same 300 trades, as
+    # concurrent polls of one symbol do
+    threads = 4
+    inserted = [0] * threads
+    errors = []
+    barrier = threading.Barrier(threads)
+    
+    def write(worker: int) -> None:
+        barrier.wait()
+        try:
+            for page in range(26):
+                first = (page + worker * 7) % 26 * 10
+                inserted[worker] += len(storage.store_trades(trade_batch("DUP", first, 50)))
+        except Exception as e:
+            errors.append(e)
+    
+    workers = [threading.Thread(target=write, args=(worker,)) for worker in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    assert errors == []
+    stored = {
+        trade_id
+        for batch in storage.iter_recent_trade_batches("DUP", 10_000, 0.0, 1000)
+        for trade_id in batch.trade_ids
+    }
+    assert len(stored) == sum(inserted)
+    assert stored == {f"DUP-{i}" for i in range(300)}
+
+def test_store_trades_skips_stored_duplicates(storage):
+    assert len(storage.store_trades(trade_batch("DUP", 0, 20))) == 20
+    inserted = storage.store_trades(trade_batch("DUP", 10, 20))
+    assert inserted.trade_ids == [f"DUP-{i}" for i in reversed(range(20, 30))]
+    assert storage.newest_trade("DUP").trade_id == "DUP-29"
+
+def test_incomplete_backend_fails_at_construction():
+    class OrderBooksOnly(vwd.StorageBackend):
+        def store_order_book(self, order_book, collection_name="order_books"):
+            return True
+        
+        def latest_order_book(self, symbol):
+            return None
+    
+    with pytest.raises(TypeError, match="store_trades"):
+        OrderBooksOnly()
+
+@pytest.mark.parametrize("call", [
+    lambda: vwd.get_order_book_history("VIC", 0),
+    lambda: vwd.rebuild_volume_profile("VIC", date(2026, 1, 5)),
+    lambda: vwd.export_history(["VIC"], date(2026, 1, 5))
+], ids=["order_book_history", "rebuild_volume_profile", "export_history"])
+def test_mongo_only_features_reject_other_storage(storage, call):
+    with pytest.raises(ValueError, match=f"not available on {storage.name} storage"):
+        call()
+
+class FailingInserts:
+    """Collection whose insert_many raises a BulkWriteError with the given details"""
+    
+    def __init__(self, **details):
+        self.details = {"writeErrors": [], "writeConcernErrors": [], **details}
+    
+    def insert_many(self, docs, ordered=True):
+        raise pymongo.errors.BulkWriteError(self.details)
+
+def duplicate(index: int) -> dict:
+    return {"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"}
+
+def store_with_errors(monkeypatch, **details) -> TradeBatch:
+    monkeypatch.setattr(vwd, "get_database", lambda: {"trades": FailingInserts(**details)})
+    return vwd.MongoStorage().store_trades(trade_batch("BWE", 0, 3))
+
+def test_mongo_duplicates_are_skipped(monkeypatch):
+    inserted = store_with_errors(monkeypatch, writeErrors=[duplicate(0), duplicate(2)])
+    assert inserted.trade_ids == ["BWE-1"]
+
+def test_mongo_write_concern_error_fails_the_batch(monkeypatch):
+    with pytest.raises(RuntimeError, match="waiting for replication timed out"):
+        store_with_errors(
+            monkeypatch,
+            writeConcernErrors=[{"code": 64, "errmsg": "waiting for replication timed out"}]
+        )
+
+def test_mongo_failure_reports_the_real_error(monkeypatch):
+    with pytest.raises(RuntimeError, match="document too large"):
+        store_with_errors(
+            monkeypatch,
+            writeErrors=[duplicate(0), {"index": 1, "code": 10334, "errmsg": "document too large"}]
+        )
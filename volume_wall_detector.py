@@ -1,13 +1,55 @@
+import array
+import asyncio
+import atexit
+import argparse
+import copy
+import heapq
+import json
+import logging
+import math
 import os
+import queue
+import random
+import signal
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
 from datetime import date, datetime, timedelta, timezone
 from dataclasses import dataclass, asdict
-from typing import List, Optional, Union, Dict, Any
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Union, Dict, Any
 import pymongo
+import pymongo.errors
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import time
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+
+try:
+    import aiohttp
+except ImportError:  # Only needed for the async multi-symbol pipeline
+    aiohttp = None
+
+try:
+    import numpy as np
+except ImportError:  # Fall back to the pure-Python aggregation
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed to export to and analyze from columnar files
+    pa = None
+    pq = None
 
 load_dotenv()
 
@@ -23,16 +65,249 @@ MONGO_AUTH_SOURCE = os.getenv("MONGO_AUTH_SOURCE")
 MONGO_AUTH_MECHANISM = os.getenv("MONGO_AUTH_MECHANISM")
 
 # Optional environment variables
-PAGE_SIZE = os.getenv("PAGE_SIZE", 50)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")  # "mongo", "sqlite" or "memory"
+SQLITE_PATH = os.getenv("SQLITE_PATH", "volume_walls.db")
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
 TRADES_TO_FETCH = int(os.getenv("TRADES_TO_FETCH", "10000"))
 DAYS_TO_FETCH = int(os.getenv("DAYS_TO_FETCH", "1"))  # Default to 1 day if not specified
+ANALYSIS_BACKEND = os.getenv("ANALYSIS_BACKEND", "python")  # "python", "mongo" or "profile"
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "30"))  # Seconds; 0 disables the cache
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))
+TRADE_CURSOR_BATCH_SIZE = int(os.getenv("TRADE_CURSOR_BATCH_SIZE", "5000"))  # Trades per streamed chunk
+TRADE_WRITE_BATCH_SIZE = int(os.getenv("TRADE_WRITE_BATCH_SIZE", "1000"))  # Trades per store while pages are still being fetched
+FETCH_PIPELINE_DEPTH = int(os.getenv("FETCH_PIPELINE_DEPTH", "4"))  # Fetched pages buffered ahead of the writer
+WATCHLIST = os.getenv("WATCHLIST", "")  # e.g. "VIC:5,HPG:15,FPT" (symbol[:poll interval in seconds])
+SCHEDULER_DEFAULT_INTERVAL = float(os.getenv("SCHEDULER_DEFAULT_INTERVAL", "60"))  # Seconds
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))  # Symbols refreshed at once
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "0.1"))  # Fraction of each interval
+ROLLING_WINDOWS = tuple(int(w) for w in os.getenv("ROLLING_WINDOWS", "60,300,900,3600").split(","))  # Seconds
+ORDER_BOOK_HISTORY_RETENTION = int(os.getenv("ORDER_BOOK_HISTORY_RETENTION", str(7 * 24 * 3600)))  # Seconds
+WALL_VOLUME_MULTIPLE = float(os.getenv("WALL_VOLUME_MULTIPLE", "3"))  # Band volume vs median band volume
+WALL_BAND_WIDTH = float(os.getenv("WALL_BAND_WIDTH", "0.1"))  # Price width of a band; 0 keeps single levels
+WALL_RECENCY_HALF_LIFE = float(os.getenv("WALL_RECENCY_HALF_LIFE", "3600"))  # Seconds
+WALL_MAX_RESULTS = int(os.getenv("WALL_MAX_RESULTS", "5"))
+WALL_DEPTH_WEIGHT = float(os.getenv("WALL_DEPTH_WEIGHT", "1"))  # Resting order book volume vs traded volume; 0 ignores depth
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")  # Root of the exported trades/order_books files
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "arrow")  # "arrow" (IPC, memory-mappable) or "parquet"
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(os.cpu_count() or 1)))  # Processes for analyze_many
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", "10"))  # Requests per second across all symbols
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", "10"))
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "10"))  # Symbols fetched concurrently
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))  # Keep-alive connections to API_BASE_URL
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3.05"))  # Seconds
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "10"))  # Seconds
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+API_BACKOFF_FACTOR = float(os.getenv("API_BACKOFF_FACTOR", "0.5"))  # Seconds, doubled per retry
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", "10"))  # Seconds
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics for Prometheus with --serve; 0 disables
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "0"))  # Seconds between metrics log lines with --serve; 0 disables
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 # Headers for API requests
 HEADERS: dict = {
         "User-Agent": "Mozilla/5.0",
-        "Accept": "application/json"
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate"
     }
 
+logger = logging.getLogger("volume_wall_detector")
+
+class _NullSpan:
+    """Shared no-op span handed out while metrics are disabled"""
+    __slots__ = ()
+    
+    def __enter__(self) -> "_NullSpan":
+        return self
+    
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("_metrics", "_key", "_start")
+    
+    def __init__(self, metrics: "Metrics", key: tuple):
+        self._metrics = metrics
+        self._key = key
+    
+    def __enter__(self) -> "_Span":
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, *_) -> bool:
+        self._metrics._observe(self._key, time.perf_counter() - self._start)
+        if exc_type is not None:
+            self._metrics._add(self._metrics._counters, (self._key[0] + "_errors", self._key[1]), 1)
+        return False
+
+class Metrics:
+    """
+    In-process timing spans, counters and gauges for the hot paths
+    
+    Spans record durations into Prometheus-style histograms keyed by name
+    and labels. Failed spans also count `<name>_errors`. While disabled
+    (METRICS_ENABLED unset) every call returns after a single attribute
+    check and span() hands back one shared no-op context manager, so
+    instrumented code pays next to nothing.
+    """
+    # Histogram bucket upper bounds, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    PREFIX = "vwd_"
+    
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = {}
+        self._gauges: Dict[tuple, float] = {}
+        # (name, labels) -> [count, sum, max, per-bucket counts...]
+        self._timings: Dict[tuple, list] = {}
+    
+    def span(self, name: str, **labels):
+        """Context manager timing its block as `name`"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, (name, tuple(sorted(labels.items()))))
+    
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        """Add `value` to a counter"""
+        if self.enabled:
+            self._add(self._counters, (name, tuple(sorted(labels.items()))), value)
+    
+    def gauge(self, name: str, value: float, **labels) -> None:
+        """Set a gauge to its latest value"""
+        if self.enabled:
+            with self._lock:
+                self._gauges[(name, tuple(sorted(labels.items())))] = value
+    
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record one duration, as a span would"""
+        if self.enabled:
+            self._observe((name, tuple(sorted(labels.items()))), seconds)
+    
+    def timed_iter(self, name: str, iterable, **labels):
+        """
+        Iterate `iterable`, timing only the time spent producing items
+        
+        Useful for cursors, where the consumer's work between items should
+        not count. The total is recorded once, when iteration ends.
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self._observe((name, tuple(sorted(labels.items()))), elapsed)
+    
+    def _add(self, table: Dict[tuple, float], key: tuple, value: float) -> None:
+        with self._lock:
+            table[key] = table.get(key, 0) + value
+    
+    def _observe(self, key: tuple, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = self._timings[key] = [0, 0.0, 0.0] + [0] * len(self.BUCKETS)
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+            for index, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    timing[3 + index] += 1
+                    break
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Every metric as a flat record, e.g. for structured logs"""
+        with self._lock:
+            records = [
+                {"type": "counter", "name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+            records += [
+                {"type": "gauge", "name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._gauges.items()
+            ]
+            records += [
+                {
+                    "type": "timing",
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": timing[0],
+                    "sum_seconds": timing[1],
+                    "max_seconds": timing[2],
+                    "mean_ms": timing[1] / timing[0] * 1e3 if timing[0] else 0.0
+                }
+                for (name, labels), timing in self._timings.items()
+            ]
+        return records
+    
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        def render_labels(labels: tuple, extra: tuple = ()) -> str:
+            pairs = [f'{key}="{value}"' for key, value in labels + extra]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+        
+        lines = []
+        with self._lock:
+            for kind, table, suffix in (("counter", self._counters, "_total"), ("gauge", self._gauges, "")):
+                typed = set()
+                for (name, labels), value in sorted(table.items()):
+                    metric = self.PREFIX + name + suffix
+                    if metric not in typed:
+                        lines.append(f"# TYPE {metric} {kind}")
+                        typed.add(metric)
+                    lines.append(f"{metric}{render_labels(labels)} {value}")
+            typed = set()
+            for (name, labels), timing in sorted(self._timings.items()):
+                metric = self.PREFIX + name + "_seconds"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                cumulative = 0
+                for bound, bucket_count in zip(self.BUCKETS, timing[3:]):
+                    cumulative += bucket_count
+                    lines.append(f"{metric}_bucket{render_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{metric}_bucket{render_labels(labels, (('le', '+Inf'),))} {timing[0]}")
+                lines.append(f"{metric}_sum{render_labels(labels)} {timing[1]}")
+                lines.append(f"{metric}_count{render_labels(labels)} {timing[0]}")
+        return "\n".join(lines) + "\n"
+    
+    def log(self) -> None:
+        """Write every metric to the module logger as one JSON line each"""
+        for record in self.snapshot():
+            logger.info(json.dumps(record, sort_keys=True))
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    """The process-wide Metrics registry"""
+    return _metrics
+
 def MONGO_URL() -> str:
         """Build MongoDB connection URL from components"""
         if MONGO_USER and MONGO_PASSWORD:
@@ -43,6 +318,169 @@ def MONGO_URL() -> str:
             )
         return f"mongodb://{MONGO_HOST}:{MONGO_PORT}/{MONGO_DATABASE}"
 
+# Process-wide MongoDB client, created lazily and shared by all callers.
+# MongoClient is thread-safe and pools its own connections, but it must not
+# be shared across fork(), so the owning pid is tracked alongside it.
+_mongo_client: Optional[MongoClient] = None
+_mongo_client_pid: Optional[int] = None
+_mongo_client_lock = threading.Lock()
+
+def get_mongo_client() -> MongoClient:
+    """Return the shared MongoClient, creating it on first use in this process"""
+    global _mongo_client, _mongo_client_pid
+    
+    pid = os.getpid()
+    client = _mongo_client
+    if client is not None and _mongo_client_pid == pid:
+        return client
+    
+    with _mongo_client_lock:
+        if _mongo_client is None or _mongo_client_pid != pid:
+            with _metrics.span("mongo_connect"):
+                _mongo_client = MongoClient(
+                    MONGO_URL(),
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                )
+            _mongo_client_pid = pid
+        return _mongo_client
+
+def get_database():
+    """Return the configured database on the shared MongoClient"""
+    ensure_indexes()
+    return get_mongo_client()[MONGO_DATABASE]
+
+def close_mongo_client() -> None:
+    """Close the shared MongoClient; the next call to get_mongo_client reconnects"""
+    global _mongo_client, _mongo_client_pid
+    
+    with _mongo_client_lock:
+        client, owner_pid = _mongo_client, _mongo_client_pid
+        _mongo_client = None
+        _mongo_client_pid = None
+    
+    # Never close a client inherited from a parent process: its sockets
+    # belong to the parent and closing them here would break it.
+    if client is not None and owner_pid == os.getpid():
+        client.close()
+
+def _reset_mongo_client_after_fork() -> None:
+    """Drop the inherited client in a forked child so it builds its own"""
+    global _mongo_client, _mongo_client_pid, _mongo_client_lock
+    _mongo_client = None
+    _mongo_client_pid = None
+    _mongo_client_lock = threading.Lock()
+
+atexit.register(close_mongo_client)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_mongo_client_after_fork)
+
+# Fields read back by get_recent_trades, in covering index order
+TRADE_FIELDS = ("trade_id", "symbol", "price", "volume", "side", "time")
+
+# Bump INDEX_SCHEMA_VERSION whenever MONGO_INDEXES changes so deployments
+# that already recorded the previous version create the new indexes.
+INDEX_SCHEMA_VERSION = 4
+MONGO_INDEXES: Dict[str, List[pymongo.IndexModel]] = {
+    "order_books": [
+        pymongo.IndexModel([("symbol", 1), ("timestamp", -1)]),
+    ],
+    "order_book_history": [
+        pymongo.IndexModel([("s", 1), ("t", -1)]),
+    ],
+    "trades": [
+        pymongo.IndexModel([("trade_id", 1)], unique=True),
+        # Serves get_recent_trades as an index-only scan: equality on symbol,
+        # range + sort on time, and every projected field in the key. Its
+        # (symbol, time) prefix also serves every other per-symbol time query,
+        # so no separate (symbol, time) index is kept here.
+        pymongo.IndexModel(
+            [
+                ("symbol", 1),
+                ("time", -1),
+                ("trade_id", 1),
+                ("price", 1),
+                ("volume", 1),
+                ("side", 1)
+            ],
+            name="symbol_time_covering"
+        ),
+    ],
+    "volume_profiles": [
+        pymongo.IndexModel([("symbol", 1), ("day", 1), ("price", 1)], unique=True),
+    ],
+}
+
+# Top-of-book snapshots, one compact document per poll:
+#   t: snapshot time (BSON date), s: symbol, p: match price,
+#   b/bv: bid price/volume, a/av: ask price/volume,
+#   c: change percent, v: session volume
+ORDER_BOOK_HISTORY = "order_book_history"
+
+def _create_order_book_history(db) -> None:
+    """
+    Create the order book history collection if it does not exist yet
+    
+    It is a time-series collection bucketed by symbol where the server
+    supports one (MongoDB 5.0+), and a regular collection with a TTL index
+    otherwise. Either way snapshots expire after ORDER_BOOK_HISTORY_RETENTION.
+    """
+    if ORDER_BOOK_HISTORY in db.list_collection_names():
+        return
+    try:
+        db.create_collection(
+            ORDER_BOOK_HISTORY,
+            timeseries={"timeField": "t", "metaField": "s", "granularity": "seconds"},
+            expireAfterSeconds=ORDER_BOOK_HISTORY_RETENTION
+        )
+    except pymongo.errors.CollectionInvalid:
+        pass  # Created concurrently by another process
+    except pymongo.errors.OperationFailure:
+        db[ORDER_BOOK_HISTORY].create_index([("t", 1)], expireAfterSeconds=ORDER_BOOK_HISTORY_RETENTION)
+
+_indexes_ensured = False
+_indexes_lock = threading.Lock()
+
+def ensure_indexes(force: bool = False) -> None:
+    """
+    Create the collection indexes once per process and once per deployment
+    
+    The installed INDEX_SCHEMA_VERSION is recorded in the schema_meta
+    collection, so a process starting against an up-to-date deployment only
+    pays a single find_one instead of one create_index per index.
+    
+    Args:
+        force: Recreate the indexes even if they are already recorded
+    """
+    global _indexes_ensured
+    
+    if _indexes_ensured and not force:
+        return
+    
+    with _indexes_lock:
+        if _indexes_ensured and not force:
+            return
+        
+        db = get_mongo_client()[MONGO_DATABASE]
+        marker = db.schema_meta.find_one({"_id": "indexes"})
+        if force or not marker or marker.get("version") != INDEX_SCHEMA_VERSION:
+            _create_order_book_history(db)
+            for collection_name, indexes in MONGO_INDEXES.items():
+                with _metrics.span("mongo_create_indexes", collection=collection_name):
+                    db[collection_name].create_indexes(indexes)
+            db.schema_meta.update_one(
+                {"_id": "indexes"},
+                {"$set": {
+                    "version": INDEX_SCHEMA_VERSION,
+                    "updated_at": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+        _indexes_ensured = True
+
 def parse_timezone(tz_str: str) -> timezone:
     """Parse timezone string (e.g., 'GMT+7' or 'GMT-5') into timezone object"""
     try:
@@ -54,13 +492,84 @@ def parse_timezone(tz_str: str) -> timezone:
     except Exception as e:
         raise ValueError(f"Invalid timezone format: {tz_str}. Error: {str(e)}")
 
+# TIMEZONE is fixed for the life of the process, so parse it once
+TZINFO = parse_timezone(TIMEZONE)
+
+def format_trade_time(timestamp: float) -> str:
+    """Render a trade epoch timestamp in the configured timezone"""
+    return str(datetime.fromtimestamp(timestamp, tz=TZINFO))
+
 class OrderBookLevel(BaseModel):
     """Order book level with price and volume"""
     price: float
     volume: int
 
+class OrderBookDepth:
+    """
+    Resting bid and ask levels of an order book, best price first
+    
+    Struct-of-arrays like TradeBatch: 16 bytes per level in `array.array`
+    columns, holding every level the API exposes rather than just the top.
+    """
+    __slots__ = ("bid_prices", "bid_volumes", "ask_prices", "ask_volumes")
+    
+    def __init__(self):
+        self.bid_prices = array.array("d")
+        self.bid_volumes = array.array("q")
+        self.ask_prices = array.array("d")
+        self.ask_volumes = array.array("q")
+    
+    def __len__(self) -> int:
+        return len(self.bid_prices) + len(self.ask_prices)
+    
+    @classmethod
+    def from_payload(cls, data: Dict[str, Any]) -> "OrderBookDepth":
+        """Read the b{n}/b{n}v and o{n}/o{n}v levels of a /v2/stock/{symbol} payload"""
+        depth = cls()
+        level = 1
+        while f"b{level}" in data or f"o{level}" in data:
+            for prices, volumes, price_key in (
+                (depth.bid_prices, depth.bid_volumes, f"b{level}"),
+                (depth.ask_prices, depth.ask_volumes, f"o{level}")
+            ):
+                price = data.get(price_key)
+                volume = data.get(price_key + "v")
+                if price and volume:  # Empty levels come back as 0 or null
+                    prices.append(price)
+                    volumes.append(int(volume))
+            level += 1
+        return depth
+    
+    def to_doc(self) -> Dict[str, list]:
+        """Plain-list form for storage"""
+        return {
+            "bid_prices": self.bid_prices.tolist(),
+            "bid_volumes": self.bid_volumes.tolist(),
+            "ask_prices": self.ask_prices.tolist(),
+            "ask_volumes": self.ask_volumes.tolist()
+        }
+    
+    @classmethod
+    def from_doc(cls, doc: Dict[str, list]) -> "OrderBookDepth":
+        """Inverse of to_doc"""
+        depth = cls()
+        depth.bid_prices.extend(doc["bid_prices"])
+        depth.bid_volumes.extend(doc["bid_volumes"])
+        depth.ask_prices.extend(doc["ask_prices"])
+        depth.ask_volumes.extend(doc["ask_volumes"])
+        return depth
+    
+    def levels(self) -> Dict[str, List[List[float]]]:
+        """[price, volume] pairs per side, for analysis results"""
+        return {
+            "bids": [[price, volume] for price, volume in zip(self.bid_prices, self.bid_volumes)],
+            "asks": [[price, volume] for price, volume in zip(self.ask_prices, self.ask_volumes)]
+        }
+
 class OrderBook(BaseModel):
     """Order book data"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
     symbol: str
     timestamp: str
     match_price: float
@@ -68,6 +577,9 @@ class OrderBook(BaseModel):
     ask_1: OrderBookLevel
     change_percent: float
     volume: int
+    # Every exposed level, best first; None for books stored before depth
+    # capture. Storage backends serialize it with to_doc()
+    depth: Optional[OrderBookDepth] = Field(default=None, exclude=True)
 
 class Trade(BaseModel):
     """Trade data"""
@@ -83,6 +595,110 @@ class Trade(BaseModel):
         """Calculate trade value"""
         return self.price * self.volume
 
+# Compact side codes used by TradeBatch and the aggregation engines
+SIDE_BUY, SIDE_SELL, SIDE_AFTER_HOUR = range(3)
+SIDE_NAMES = ("bu", "sd", "after-hour")
+SIDE_CODES = {"bu": SIDE_BUY, "sd": SIDE_SELL}
+
+class TradeBatch:
+    """
+    Struct-of-arrays trades for one symbol, newest first
+    
+    Internal hot-path representation: numeric columns live in `array.array`
+    buffers (25 bytes per trade plus the trade_id string) and can be viewed
+    as NumPy arrays without copying. Convert to pydantic Trade models only
+    at the API boundary with to_trades().
+    """
+    __slots__ = ("symbol", "trade_ids", "prices", "volumes", "sides", "times")
+    
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.trade_ids: List[str] = []
+        self.prices = array.array("d")
+        self.volumes = array.array("q")
+        self.sides = array.array("b")
+        self.times = array.array("d")
+    
+    def __len__(self) -> int:
+        return len(self.trade_ids)
+    
+    def append(self, trade_id: str, price: float, volume: int, side: int, time: float) -> None:
+        """Append one trade; `side` is a SIDE_* code"""
+        self.trade_ids.append(trade_id)
+        self.prices.append(price)
+        self.volumes.append(volume)
+        self.sides.append(side)
+        self.times.append(time)
+    
+    def __getitem__(self, index: slice) -> "TradeBatch":
+        """Slice rows into a new batch"""
+        batch = TradeBatch(self.symbol)
+        batch.trade_ids = self.trade_ids[index]
+        batch.prices = self.prices[index]
+        batch.volumes = self.volumes[index]
+        batch.sides = self.sides[index]
+        batch.times = self.times[index]
+        return batch
+    
+    def extend(self, other: "TradeBatch") -> None:
+        """Append every row of another batch"""
+        self.trade_ids.extend(other.trade_ids)
+        self.prices.extend(other.prices)
+        self.volumes.extend(other.volumes)
+        self.sides.extend(other.sides)
+        self.times.extend(other.times)
+    
+    def select(self, rows: List[int]) -> "TradeBatch":
+        """New batch holding only the given row positions"""
+        batch = TradeBatch(self.symbol)
+        for row in rows:
+            batch.append(self.trade_ids[row], self.prices[row], self.volumes[row], self.sides[row], self.times[row])
+        return batch
+    
+    def columns(self) -> tuple:
+        """Zero-copy NumPy views of (prices, volumes, sides, times)"""
+        return (
+            np.frombuffer(self.prices, dtype=np.float64),
+            np.frombuffer(self.volumes, dtype=np.int64),
+            np.frombuffer(self.sides, dtype=np.int8),
+            np.frombuffer(self.times, dtype=np.float64)
+        )
+    
+    @classmethod
+    def from_trades(cls, trades: List[Trade], symbol: Optional[str] = None) -> "TradeBatch":
+        """Build a batch from pydantic Trade models"""
+        batch = cls(symbol or (trades[0].symbol if trades else ""))
+        for trade in trades:
+            batch.append(trade.trade_id, trade.price, trade.volume, SIDE_CODES.get(trade.side, SIDE_AFTER_HOUR), trade.time)
+        return batch
+    
+    @classmethod
+    def from_docs(cls, symbol: str, docs) -> "TradeBatch":
+        """Build a batch from stored trade documents"""
+        batch = cls(symbol)
+        for doc in docs:
+            batch.append(doc["trade_id"], doc["price"], doc["volume"], SIDE_CODES.get(doc["side"], SIDE_AFTER_HOUR), doc["time"])
+        return batch
+    
+    def to_docs(self) -> List[Dict[str, Any]]:
+        """Trade documents in the stored schema"""
+        return [
+            {
+                "trade_id": trade_id,
+                "symbol": self.symbol,
+                "price": price,
+                "volume": volume,
+                "side": SIDE_NAMES[side],
+                "time": trade_time
+            }
+            for trade_id, price, volume, side, trade_time
+            in zip(self.trade_ids, self.prices, self.volumes, self.sides, self.times)
+        ]
+    
+    def to_trades(self) -> List[Trade]:
+        """Validated pydantic Trade models, for the API/MCP boundary"""
+        return [Trade(**doc) for doc in self.to_docs()]
+
 class PriceVolumeData(BaseModel):
     """Volume and value data at a price level"""
     buy_volume: int = 0
@@ -101,6 +717,8 @@ class PriceVolumeData(BaseModel):
     value_imbalance: float = 0.0
     total_trades: int = 0
     last_trade_time: Optional[str] = None
+    # Raw epoch behind last_trade_time, so wall detection need not parse it back
+    last_time: Optional[float] = Field(default=None, exclude=True)
 
 class AfterHourVolume(BaseModel):
     """After-hour trading volume data"""
@@ -179,284 +797,1713 @@ class StoreResult(BaseModel):
     order_book: MongoResult
     trades: TradesResult
 
-def store_stock_data(data: Union[OrderBook, List[Trade]], collection_name: str) -> MongoResult:
-    """Store stock data into MongoDB"""
-    result = MongoResult()
+@dataclass(frozen=True)
+class TradeWatermark:
+    """Newest trade already stored for a symbol"""
+    trade_id: str
+    time: float
+
+# Committed for a symbol with no stored trades, so that a first fetch that
+# fails part-way is retried in full rather than from its newest stored trade
+_NO_TRADES_WATERMARK = TradeWatermark(trade_id="", time=0.0)
+
+# Per-symbol high-water marks, seeded from the storage backend's committed
+# watermarks on first use and advanced after every fully stored fetch
+_trade_watermarks: Dict[str, TradeWatermark] = {}
+
+class AnalysisCache:
+    """
+    In-process LRU + TTL cache for analyze_stock_data results
     
-    try:
-        client = MongoClient(MONGO_URL())
-        db = client[MONGO_DATABASE]
-        collection = db[collection_name]
-        
-        # Setup indexes if they don't exist
-        if collection_name == "order_books":
-            collection.create_index([("symbol", 1), ("timestamp", -1)])
-        elif collection_name == "trades":
-            collection.create_index([("symbol", 1), ("time", -1)])
-            collection.create_index([("trade_id", 1)], unique=True)
-        
-        # Convert and store data
-        if isinstance(data, OrderBook):
-            insert_result = collection.insert_one(data.model_dump())
-            result.success = insert_result.acknowledged
-            result.inserted_count = 1 if insert_result.acknowledged else 0
-            
-        elif isinstance(data, list):
-            if not data:
-                result.success = True
-                return result
-                
-            trade_docs = [trade.model_dump() for trade in data]
-            try:
-                operations = [
-                    pymongo.UpdateOne(
-                        {"trade_id": doc["trade_id"]},
-                        {"$set": doc},
-                        upsert=True
-                    ) for doc in trade_docs
-                ]
-                
-                # Delete today's records using configured timezone
-                tz = parse_timezone(TIMEZONE)
-                today_start = datetime.now(tz).replace(
-                    hour=0, 
-                    minute=0, 
-                    second=0, 
-                    microsecond=0
-                ).timestamp()
-                
-                collection.delete_many({
-                    "symbol": trade_docs[0]["symbol"],
-                    "time": {"$gte": today_start}
-                })
-                
-                bulk_result = collection.bulk_write(operations, ordered=False)
-                result.success = True
-                result.inserted_count = bulk_result.upserted_count + bulk_result.modified_count
-            except Exception as e:
-                result.success = False
-                result.error = f"Bulk upsert failed: {str(e)}"
-                
-    except Exception as e:
-        result.error = str(e)
-    finally:
-        client.close()
-        
-    return result
+    Each symbol has a data version that ingestion bumps whenever it writes
+    new data for that symbol. Entries remember the version they were
+    computed from and are treated as misses once it moves on, so
+    invalidation is O(1) and a computation racing an ingest can never
+    publish a stale result.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+    
+    def version(self, symbol: str) -> int:
+        """Current data version of a symbol"""
+        return self._versions.get(symbol, 0)
+    
+    def get(self, key: tuple) -> Optional[dict]:
+        """Return a copy of the cached result for `key`, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, version, result = entry
+            if version != self.version(key[0]):
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(result)
+    
+    def put(self, key: tuple, version: int, result: dict) -> None:
+        """Cache `result`, computed from data at `version` of key's symbol"""
+        with self._lock:
+            if version != self.version(key[0]):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, version, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, symbol: str) -> None:
+        """Mark every cached result for `symbol` as stale"""
+        with self._lock:
+            self._versions[symbol] = self.version(symbol) + 1
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
 
-def fetch_order_book(symbol) -> OrderBook:
-    """Fetch current order book data for a symbol"""
-    url = f"{API_BASE_URL}/v2/stock/{symbol}"
-    response = requests.get(url, headers=HEADERS)
-    response.raise_for_status()
-    data = response.json().get("data", {})
+_analysis_cache = AnalysisCache(ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TTL)
+
+def get_analysis_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters of the analyze_stock_data cache"""
+    return _analysis_cache.stats()
+
+class _Window:
+    """Trades inside one sliding window plus running sums over them"""
+    __slots__ = ("seconds", "trades", "side_volume", "side_value", "levels")
     
-    return OrderBook(
-        symbol=symbol,
-        timestamp=datetime.now().isoformat(),
-        match_price=data.get("mp"),
-        bid_1=OrderBookLevel(
-            price=data.get("b1"),
-            volume=data.get("b1v")
-        ),
-        ask_1=OrderBookLevel(
-            price=data.get("o1"),
-            volume=data.get("o1v")
-        ),
-        change_percent=data.get("lpcp"),
-        volume=data.get("lv")
-    )
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+        self.trades: deque = deque()  # (time, price, volume, side), oldest first
+        self.side_volume = [0, 0, 0]  # Indexed by SIDE_* code
+        self.side_value = [0.0, 0.0, 0.0]
+        self.levels: Dict[float, List[int]] = {}  # price -> volume per SIDE_* code
+    
+    def push(self, trade: tuple) -> None:
+        trade_time, price, volume, side = trade
+        trades = self.trades
+        if not trades or trade_time >= trades[-1][0]:
+            trades.append(trade)
+        elif trade_time <= trades[0][0]:
+            trades.appendleft(trade)
+        else:
+            trades.insert(bisect_right(trades, trade_time, key=lambda row: row[0]), trade)
+        self.side_volume[side] += volume
+        self.side_value[side] += price * volume
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = [0, 0, 0]
+        level[side] += volume
+    
+    def evict(self, now: float) -> None:
+        cutoff = now - self.seconds
+        while self.trades and self.trades[0][0] < cutoff:
+            _, price, volume, side = self.trades.popleft()
+            self.side_volume[side] -= volume
+            self.side_value[side] -= price * volume
+            level = self.levels[price]
+            level[side] -= volume
+            if not any(level):
+                del self.levels[price]
+        if not self.trades:
+            # Drop accumulated float error once the window drains
+            self.side_value = [0.0, 0.0, 0.0]
 
-def fetch_trades(symbol: str) -> List[Trade]:
+class RollingTradeWindows:
     """
-    Fetch specified number of trades for a symbol using lastId pagination
+    Sliding-window trade analytics for one symbol, updated as trades arrive
     
-    Args:
-        symbol: Stock symbol
-        
-    Returns:
-        List[Trade]: List of trades, newest first
+    Each window keeps its trades in a deque with running side sums and
+    per-level volumes. Adding a trade and expiring one are O(1), so
+    snapshots cost O(levels in the window) and never touch MongoDB. Windows
+    slide on trade time; the newest trade seen is "now" unless a wall-clock
+    time is passed to snapshot().
     """
-    trades = []
-    last_id = None
     
-    while len(trades) < TRADES_TO_FETCH:
-        # Prepare request parameters
-        params = {
-            "stockSymbol": symbol,
-            "pageSize": min(PAGE_SIZE, TRADES_TO_FETCH - len(trades))
-        }
-        if last_id:
-            params["lastId"] = last_id
-            
-        # Make API request
-        url = f"{API_BASE_URL}/le-table"
-        response = requests.get(url, headers=HEADERS, params=params)
-        response.raise_for_status()
+    def __init__(self, symbol: str, windows: tuple = ROLLING_WINDOWS):
+        self.symbol = symbol
+        self._windows = [_Window(seconds) for seconds in windows]
+        self._newest = float("-inf")
+        self._bid_price: Optional[float] = None
+        self._ask_price: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def add(self, trades: TradeBatch) -> None:
+        """Add newly ingested trades (newest first, as fetched)"""
+        if not trades:
+            return
+        with self._lock:
+            rows = list(zip(trades.times, trades.prices, trades.volumes, trades.sides))
+            if rows[0][0] >= self._newest:
+                rows.reverse()  # Newer than anything held: append oldest first
+            # Otherwise the batch is older than what is held, e.g. a later page
+            # of a pipelined fetch; newest first keeps inserts at the front
+            self._newest = max(self._newest, trades.times[0])
+            for window in self._windows:
+                cutoff = self._newest - window.seconds
+                for trade in rows:
+                    if trade[0] >= cutoff:
+                        window.push(trade)
+                window.evict(self._newest)
+    
+    def update_quote(self, bid_price: float, ask_price: float) -> None:
+        """Record the latest bid/ask used to classify after-hour volume"""
+        with self._lock:
+            self._bid_price = bid_price
+            self._ask_price = ask_price
+    
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Current analytics per window
         
-        # Process response
-        items = response.json().get("data", {}).get("items", [])
-        if not items:  # No more trades available
-            break
+        Args:
+            now: Epoch seconds to slide the windows to (defaults to the newest trade)
             
-        # Convert items to Trade objects
-        batch_trades = [
-            Trade(
-                trade_id=item["_id"],
-                symbol=item["stockSymbol"],
-                price=item["price"],
-                volume=item["vol"],
-                side=item["side"] if item.get("side") in ["bu", "sd"] else "after-hour",
-                time=datetime.combine(date.today(), datetime.strptime(item["time"], "%H:%M:%S").time()).timestamp()
-            ) for item in items
-        ]
-        
-        trades.extend(batch_trades)
-        
-        # Update last_id for next iteration
-        last_id = items[-1]["_id"]
-        
-        # Add small delay to avoid hitting rate limits
-        time.sleep(0.1)
+        Returns:
+            Dict[str, Any]: Per-window trades, side volumes, buy_ratio,
+            imbalance and volume per price level, keyed like "5m"
+        """
+        with self._lock:
+            now = self._newest if now is None else max(now, self._newest)
+            snapshot = {}
+            for window in self._windows:
+                window.evict(now)
+                snapshot[f"{window.seconds // 60}m" if window.seconds % 60 == 0 else f"{window.seconds}s"] = (
+                    self._window_snapshot(window)
+                )
+            return snapshot
     
-    return trades[:TRADES_TO_FETCH]  # Ensure we don't return more than requested
+    def _window_snapshot(self, window: _Window) -> Dict[str, Any]:
+        # Classify after-hour volume per level against the latest quote,
+        # as analyze_volume_at_price does
+        after_hour = [0, 0, 0]  # buy, sell, unknown
+        for price, level in window.levels.items():
+            if not level[SIDE_AFTER_HOUR]:
+                continue
+            if self._ask_price is not None and price >= self._ask_price:
+                after_hour[0] += level[SIDE_AFTER_HOUR]
+            elif self._bid_price is not None and price <= self._bid_price:
+                after_hour[1] += level[SIDE_AFTER_HOUR]
+            else:
+                after_hour[2] += level[SIDE_AFTER_HOUR]
+        
+        buy = window.side_volume[SIDE_BUY] + after_hour[0]
+        sell = window.side_volume[SIDE_SELL] + after_hour[1]
+        return {
+            "trades": len(window.trades),
+            "buy_volume": window.side_volume[SIDE_BUY],
+            "sell_volume": window.side_volume[SIDE_SELL],
+            "after_hour": {"buy": after_hour[0], "sell": after_hour[1], "unknown": after_hour[2]},
+            "total_volume": sum(window.side_volume),
+            "total_value": sum(window.side_value),
+            "buy_ratio": buy / (buy + sell) if buy + sell > 0 else 0,
+            "volume_imbalance": buy - sell,
+            "levels": {price: sum(window.levels[price]) for price in sorted(window.levels)}
+        }
 
-def fetch_and_store_stock_data(symbol: str) -> StoreResult:
+# Per-symbol rolling windows, fed by store_stock_data
+_rolling_windows: Dict[str, RollingTradeWindows] = {}
+_rolling_windows_lock = threading.Lock()
+
+def get_rolling_windows(symbol: str) -> RollingTradeWindows:
+    """Return the symbol's rolling windows, creating them on first use"""
+    windows = _rolling_windows.get(symbol)
+    if windows is None:
+        with _rolling_windows_lock:
+            windows = _rolling_windows.setdefault(symbol, RollingTradeWindows(symbol))
+    return windows
+
+def get_rolling_analytics(symbol: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """Sliding-window buy_ratio, imbalance and per-level volume for a symbol"""
+    return get_rolling_windows(symbol).snapshot(now)
+
+class StorageBackend(ABC):
     """
-    Fetch and store both order book and trades data
+    Where order books and trades are stored and read back
     
-    Returns:
-        StoreResult: Results of both operations
+    store_stock_data and the read helpers (get_latest_order_book,
+    get_recent_trades, iter_recent_trade_batches, get_trade_watermark)
+    go through the process-wide backend from get_storage(). The volume
+    profile, order book history and the server-side analysis backends are
+    MongoDB features; other backends skip them.
     """
-    # Fetch and store order book
-    order_book = fetch_order_book(symbol)
-    order_book_result = store_stock_data(order_book, "order_books")
+    name = ""
+    # analyze_stock_data backends that work on top of this storage
+    analysis_backends = ("python",)
     
-    # Fetch and store trades
-    trades = fetch_trades(symbol)
-    trades_result = store_stock_data(trades, "trades")
-    
-    return StoreResult(
-        order_book=order_book_result,
-        trades=TradesResult(
-            success=trades_result.success,
-            inserted_count=trades_result.inserted_count,
-            error=trades_result.error,
-            trades_fetched=len(trades)
-        )
-    )
-
+    @abstractmethod
+    def store_order_book(self, order_book: OrderBook, collection_name: str = "order_books") -> bool:
+        """Store one order book snapshot; returns True once acknowledged"""
+    
+    @abstractmethod
+    def store_trades(self, trades: TradeBatch, collection_name: str = "trades") -> TradeBatch:
+        """Store trades, skipping already stored trade_ids; returns the rows actually inserted"""
+    
+    def record_order_book_snapshot(self, order_book: OrderBook) -> None:
+        """Append an order book to the top-of-book history, if the backend keeps one"""
+    
+    def update_volume_profile(self, trades: TradeBatch) -> None:
+        """Fold newly inserted trades into the volume profile, if the backend keeps one"""
+    
+    @abstractmethod
+    def latest_order_book(self, symbol: str) -> Optional[OrderBook]:
+        """Most recent order book of a symbol, or None"""
+    
+    def latest_order_books(self, symbols: List[str]) -> Dict[str, OrderBook]:
+        """Latest order book per symbol, skipping symbols without one"""
+        order_books = {}
+        for symbol in symbols:
+            order_book = self.latest_order_book(symbol)
+            if order_book:
+                order_books[symbol] = order_book
+        return order_books
+    
+    @abstractmethod
+    def newest_trade(self, symbol: str) -> Optional[TradeWatermark]:
+        """Newest stored trade of a symbol, or None"""
+    
+    @abstractmethod
+    def iter_recent_trade_batches(self, symbol: str, limit: int, start: float, batch_size: int):
+        """Yield up to `limit` trades at or after `start`, newest first, in `batch_size` chunks"""
+    
+    @abstractmethod
+    def committed_watermark(self, symbol: str) -> Optional[TradeWatermark]:
+        """Watermark recorded by commit_watermark, or None if there is none yet"""
+    
+    @abstractmethod
+    def commit_watermark(self, symbol: str, watermark: TradeWatermark) -> None:
+        """Record that every trade of a symbol up to `watermark` is stored"""
+    
+    def recent_trades_by_symbol(self, symbols: List[str], limit: int, start: float) -> Dict[str, TradeBatch]:
+        """The newest `limit` trades at or after `start` of every symbol"""
+        partitions = {}
+        for symbol in symbols:
+            partitions[symbol] = TradeBatch(symbol)
+            for chunk in self.iter_recent_trade_batches(symbol, limit, start, TRADE_CURSOR_BATCH_SIZE):
+                partitions[symbol].extend(chunk)
+        return partitions
+    
+    def close(self) -> None:
+        pass
 
-def get_latest_order_book(symbol: str) -> Optional[OrderBook]:
-    """Get the latest order book from MongoDB"""
-    try:
-        client = MongoClient(MONGO_URL())
-        db = client[MONGO_DATABASE]
-        doc = db.order_books.find_one(
+class MongoStorage(StorageBackend):
+    """MongoDB storage on the shared client from get_mongo_client()"""
+    name = "mongo"
+    analysis_backends = ("python", "mongo", "profile")
+    _window_functions: Optional[bool] = None
+    
+    def store_order_book(self, order_book: OrderBook, collection_name: str = "order_books") -> bool:
+        doc = order_book.model_dump()
+        if order_book.depth is not None:
+            doc["depth"] = order_book.depth.to_doc()
+        return get_database()[collection_name].insert_one(doc).acknowledged
+    
+    def store_trades(self, trades: TradeBatch, collection_name: str = "trades") -> TradeBatch:
+        try:
+            get_database()[collection_name].insert_many(trades.to_docs(), ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Duplicate trade_ids are trades an earlier poll already stored;
+            # anything else, including a write concern error, is a real failure
+            write_errors = e.details.get("writeErrors", [])
+            failures = [error for error in write_errors if error.get("code") != 11000]
+            failures += e.details.get("writeConcernErrors", [])
+            if failures:
+                raise RuntimeError(failures[0].get("errmsg")) from e
+            duplicates = {error["index"] for error in write_errors}
+            return trades.select([row for row in range(len(trades)) if row not in duplicates])
+        return trades
+    
+    def record_order_book_snapshot(self, order_book: OrderBook) -> None:
+        get_database()[ORDER_BOOK_HISTORY].insert_one(_order_book_snapshot(order_book))
+    
+    def update_volume_profile(self, trades: TradeBatch) -> None:
+        update_volume_profile(trades)
+    
+    def latest_order_book(self, symbol: str) -> Optional[OrderBook]:
+        doc = get_database().order_books.find_one(
             {"symbol": symbol},
             sort=[("timestamp", -1)]
         )
         if doc:
-            return OrderBook(
-                symbol=doc["symbol"],
-                timestamp=doc["timestamp"],
-                match_price=doc["match_price"],
-                bid_1=OrderBookLevel(**doc["bid_1"]),
-                ask_1=OrderBookLevel(**doc["ask_1"]),
-                change_percent=doc["change_percent"],
-                volume=doc["volume"]
-            )
+            return _order_book_from_doc(doc)
         return None
-    finally:
-        client.close()
-
-def get_recent_trades(symbol: str, limit: int = 100, days: int = None) -> List[Trade]:
-    """
-    Get recent trades from MongoDB
     
-    Args:
-        symbol: Stock symbol
-        limit: Maximum number of trades to return
-        days: Number of days to look back (defaults to DAYS_TO_FETCH from env)
+    def latest_order_books(self, symbols: List[str]) -> Dict[str, OrderBook]:
+        # One aggregation instead of a query per symbol
+        pipeline = [
+            {"$match": {"symbol": {"$in": symbols}}},
+            {"$sort": {"symbol": 1, "timestamp": -1}},
+            {"$group": {"_id": "$symbol", "doc": {"$first": "$$ROOT"}}}
+        ]
+        return {
+            group["_id"]: _order_book_from_doc(group["doc"])
+            for group in get_database().order_books.aggregate(pipeline)
+        }
     
-    Returns:
-        List[Trade]: List of trades, newest first
-    """
-    try:
-        client = MongoClient(MONGO_URL())
-        db = client[MONGO_DATABASE]
-        
-        # Use provided days or fall back to environment variable
-        days_to_fetch = days if days is not None else DAYS_TO_FETCH
-        
-        # Calculate the timestamp for N days ago using configured timezone
-        tz = parse_timezone(TIMEZONE)
-        now = datetime.now(tz)
-        days_ago = now - timedelta(days=days_to_fetch)
-        start_timestamp = days_ago.replace(
-            hour=0, 
-            minute=0, 
-            second=0, 
-            microsecond=0
-        ).timestamp()
-        
-        # Query with date filter
-        trades = list(db.trades.find(
+    def newest_trade(self, symbol: str) -> Optional[TradeWatermark]:
+        doc = get_database().trades.find_one(
+            {"symbol": symbol},
+            projection={"_id": 0, "trade_id": 1, "time": 1},
+            sort=[("time", -1)]
+        )
+        if doc:
+            return TradeWatermark(trade_id=doc["trade_id"], time=doc["time"])
+        return None
+    
+    def committed_watermark(self, symbol: str) -> Optional[TradeWatermark]:
+        doc = get_database().trade_watermarks.find_one({"_id": symbol})
+        if doc:
+            return TradeWatermark(trade_id=doc["trade_id"], time=doc["time"])
+        return None
+    
+    def commit_watermark(self, symbol: str, watermark: TradeWatermark) -> None:
+        get_database().trade_watermarks.replace_one(
+            {"_id": symbol},
+            {"trade_id": watermark.trade_id, "time": watermark.time},
+            upsert=True
+        )
+    
+    def iter_recent_trade_batches(self, symbol: str, limit: int, start: float, batch_size: int):
+        # Project only indexed fields so the symbol_time_covering index
+        # answers the query without fetching documents; the hint keeps the
+        # planner off a plain (symbol, time) index where one exists
+        cursor = get_database().trades.find(
             {
                 "symbol": symbol,
-                "time": {"$gte": start_timestamp}
+                "time": {"$gte": start}
             },
+            projection={"_id": 0, **{field: 1 for field in TRADE_FIELDS}},
             sort=[("time", -1)],
-            limit=limit
-        ))
-        
-        return [Trade(
-            trade_id=t["trade_id"],
-            symbol=t["symbol"],
-            price=t["price"],
-            volume=t["volume"],
-            side=t["side"],
-            time=t["time"]
-        ) for t in trades]
-    finally:
-        client.close()
-
-def analyze_volume_at_price(trades: List[Trade], order_book: OrderBook) -> Dict[float, PriceVolumeData]:
-    """Analyze accumulated volume and value at each price level"""
-    price_volumes: Dict[float, PriceVolumeData] = {}
+            limit=limit,
+            batch_size=batch_size,
+            hint="symbol_time_covering"
+        )
+        batch = TradeBatch(symbol)
+        for doc in cursor:
+            batch.append(doc["trade_id"], doc["price"], doc["volume"], SIDE_CODES.get(doc["side"], SIDE_AFTER_HOUR), doc["time"])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = TradeBatch(symbol)
+        if batch:
+            yield batch
     
-    for trade in reversed(trades):
-        price = trade.price
-        if price not in price_volumes:
-            price_volumes[price] = PriceVolumeData()
-        
-        data = price_volumes[price]
-        # Accumulate volumes and values by side
-        if trade.side == "bu":
-            data.buy_volume += trade.volume
-            data.buy_value += trade.value
-        elif trade.side == "sd":
-            data.sell_volume += trade.volume
-            data.sell_value += trade.value
-        else:  # after-hour trade classification
-            if price >= order_book.ask_1.price:
-                data.after_hour_buy += trade.volume
-                data.after_hour_buy_value += trade.value
-            elif price <= order_book.bid_1.price:
-                data.after_hour_sell += trade.volume
-                data.after_hour_sell_value += trade.value
-            else:
-                data.after_hour_unknown += trade.volume
-                data.after_hour_unknown_value += trade.value
+    def _supports_window_functions(self) -> bool:
+        """Whether the server has $setWindowFields (MongoDB 5.0+); asked once"""
+        if self._window_functions is None:
+            version = tuple(get_mongo_client().server_info()["versionArray"][:2])
+            self._window_functions = version >= (5, 0)
+        return self._window_functions
+    
+    def recent_trades_by_symbol(self, symbols: List[str], limit: int, start: float) -> Dict[str, TradeBatch]:
+        # One streamed query in (symbol, time) order, served by the covering
+        # index. Each symbol is cut off at `limit` on the server where it
+        # can rank trades; older servers send everything since `start` and
+        # the loop below drops the excess
+        partitions = {symbol: TradeBatch(symbol) for symbol in symbols}
+        query = {"symbol": {"$in": list(partitions)}, "time": {"$gte": start}}
+        projection = {"_id": 0, **{field: 1 for field in TRADE_FIELDS}}
+        if self._supports_window_functions():
+            pipeline = [
+                {"$match": query},
+                {"$setWindowFields": {
+                    "partitionBy": "$symbol",
+                    "sortBy": {"time": -1},
+                    "output": {"rank": {"$documentNumber": {}}}
+                }},
+                {"$match": {"rank": {"$lte": limit}}},
+                {"$project": projection}
+            ]
+            with _metrics.span("mongo_aggregate", stage="recent_trades_by_symbol"):
+                cursor = get_database().trades.aggregate(
+                    pipeline, allowDiskUse=True, batchSize=TRADE_CURSOR_BATCH_SIZE
+                )
+        else:
+            cursor = get_database().trades.find(
+                query,
+                projection=projection,
+                sort=[("symbol", 1), ("time", -1)],
+                batch_size=TRADE_CURSOR_BATCH_SIZE
+            )
+        for doc in cursor:
+            batch = partitions[doc["symbol"]]
+            if len(batch) < limit:
+                batch.append(doc["trade_id"], doc["price"], doc["volume"], SIDE_CODES.get(doc["side"], SIDE_AFTER_HOUR), doc["time"])
+        return partitions
 
-        tz = parse_timezone(TIMEZONE)
-        data.total_trades += 1
-        data.last_trade_time = str(datetime.fromtimestamp(trade.time, tz=tz))
+class SQLiteStorage(StorageBackend):
+    """
+    Embedded SQLite storage for single-node deployments and load tests
     
-    # Calculate additional metrics
-    for price_data in price_volumes.values():
-        price_data.total_volume = (
-            price_data.buy_volume + 
+    The database runs in WAL mode, so readers never block the writer, and
+    each thread gets its own connection. Trades are inserted with one
+    executemany per batch, and a covering (symbol, time) index serves the
+    recent-trades scans. Connections run in autocommit mode; writes take
+    the database write lock up front with BEGIN IMMEDIATE (see
+    _transaction).
+    """
+    name = "sqlite"
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS trades (
+            trade_id TEXT PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            price REAL NOT NULL,
+            volume INTEGER NOT NULL,
+            side INTEGER NOT NULL,
+            time REAL NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS trades_symbol_time ON trades (symbol, time DESC, price, volume, side)",
+        """CREATE TABLE IF NOT EXISTS order_books (
+            symbol TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            match_price REAL NOT NULL,
+            bid_price REAL NOT NULL,
+            bid_volume INTEGER NOT NULL,
+            ask_price REAL NOT NULL,
+            ask_volume INTEGER NOT NULL,
+            change_percent REAL NOT NULL,
+            volume INTEGER NOT NULL,
+            depth TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS order_books_symbol_timestamp ON order_books (symbol, timestamp DESC)",
+        """CREATE TABLE IF NOT EXISTS trade_watermarks (
+            symbol TEXT PRIMARY KEY,
+            trade_id TEXT NOT NULL,
+            time REAL NOT NULL
+        )""",
+    )
+    # Bound parameters per "IN (...)" lookup, under SQLite's default limit
+    MAX_VARIABLES = 900
+    
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        with self._transaction() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            # Databases created before depth capture lack the depth column
+            if "depth" not in {row[1] for row in conn.execute("PRAGMA table_info(order_books)")}:
+                conn.execute("ALTER TABLE order_books ADD COLUMN depth TEXT")
+    
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """
+        Write transaction holding the database write lock from its first statement
+        
+        Python's default transaction handling only begins a transaction at
+        the first INSERT, so a check-then-insert could interleave with
+        another connection's insert of the same rows.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    
+    @staticmethod
+    def _check_table(collection_name: str, table: str) -> None:
+        if collection_name != table:
+            raise ValueError(f"SQLite storage keeps {table} in the {table} table, not {collection_name}")
+    
+    def store_order_book(self, order_book: OrderBook, collection_name: str = "order_books") -> bool:
+        self._check_table(collection_name, "order_books")
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO order_books VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (order_book.symbol, order_book.timestamp, order_book.match_price,
+                 order_book.bid_1.price, order_book.bid_1.volume,
+                 order_book.ask_1.price, order_book.ask_1.volume,
+                 order_book.change_percent, order_book.volume,
+                 json.dumps(order_book.depth.to_doc()) if order_book.depth is not None else None)
+            )
+        return True
+    
+    def store_trades(self, trades: TradeBatch, collection_name: str = "trades") -> TradeBatch:
+        self._check_table(collection_name, "trades")
+        with self._transaction() as conn:
+            # Find stored trade_ids first so the caller learns exactly which
+            # rows are new; the write lock, held since BEGIN IMMEDIATE, keeps
+            # other connections from inserting between the check and insert
+            seen = set()
+            for start in range(0, len(trades), self.MAX_VARIABLES):
+                trade_ids = trades.trade_ids[start:start + self.MAX_VARIABLES]
+                placeholders = ", ".join("?" * len(trade_ids))
+                seen.update(row[0] for row in conn.execute(
+                    f"SELECT trade_id FROM trades WHERE trade_id IN ({placeholders})", trade_ids
+                ))
+            rows = []
+            for row, trade_id in enumerate(trades.trade_ids):
+                if trade_id not in seen:
+                    seen.add(trade_id)
+                    rows.append(row)
+            inserted = trades if len(rows) == len(trades) else trades.select(rows)
+            conn.executemany(
+                "INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?)",
+                zip(inserted.trade_ids, [trades.symbol] * len(inserted), inserted.prices,
+                    inserted.volumes, inserted.sides, inserted.times)
+            )
+        return inserted
+    
+    def latest_order_book(self, symbol: str) -> Optional[OrderBook]:
+        row = self._connection().execute(
+            "SELECT * FROM order_books WHERE symbol = ? ORDER BY timestamp DESC LIMIT 1", (symbol,)
+        ).fetchone()
+        if row is None:
+            return None
+        return OrderBook(
+            symbol=row[0],
+            timestamp=row[1],
+            match_price=row[2],
+            bid_1=OrderBookLevel(price=row[3], volume=row[4]),
+            ask_1=OrderBookLevel(price=row[5], volume=row[6]),
+            change_percent=row[7],
+            volume=row[8],
+            depth=OrderBookDepth.from_doc(json.loads(row[9])) if row[9] else None
+        )
+    
+    def newest_trade(self, symbol: str) -> Optional[TradeWatermark]:
+        row = self._connection().execute(
+            "SELECT trade_id, time FROM trades WHERE symbol = ? ORDER BY time DESC LIMIT 1", (symbol,)
+        ).fetchone()
+        if row is None:
+            return None
+        return TradeWatermark(trade_id=row[0], time=row[1])
+    
+    def committed_watermark(self, symbol: str) -> Optional[TradeWatermark]:
+        row = self._connection().execute(
+            "SELECT trade_id, time FROM trade_watermarks WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        if row is None:
+            return None
+        return TradeWatermark(trade_id=row[0], time=row[1])
+    
+    def commit_watermark(self, symbol: str, watermark: TradeWatermark) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO trade_watermarks VALUES (?, ?, ?)",
+                (symbol, watermark.trade_id, watermark.time)
+            )
+    
+    def iter_recent_trade_batches(self, symbol: str, limit: int, start: float, batch_size: int):
+        cursor = self._connection().execute(
+            "SELECT trade_id, price, volume, side, time FROM trades"
+            " WHERE symbol = ? AND time >= ? ORDER BY time DESC LIMIT ?",
+            (symbol, start, limit)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = TradeBatch(symbol)
+            for trade_id, price, volume, side, trade_time in rows:
+                batch.append(trade_id, price, volume, side, trade_time)
+            yield batch
+    
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+class MemoryStorage(StorageBackend):
+    """
+    Process-local storage for tests and load tests; nothing is persisted
+    
+    Trades are kept per symbol in a TradeBatch in time order (oldest
+    first, unlike everywhere else) so appends are O(1) and recent-trade
+    scans start from the end.
+    """
+    name = "memory"
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._order_books: Dict[str, Dict[str, OrderBook]] = {}  # collection -> symbol -> latest
+        self._trades: Dict[str, Dict[str, TradeBatch]] = {}  # collection -> symbol -> oldest first
+        self._trade_ids: Dict[str, set] = {}  # collection -> stored trade_ids
+        self._watermarks: Dict[str, TradeWatermark] = {}
+    
+    def store_order_book(self, order_book: OrderBook, collection_name: str = "order_books") -> bool:
+        with self._lock:
+            latest = self._order_books.setdefault(collection_name, {})
+            current = latest.get(order_book.symbol)
+            if current is None or order_book.timestamp >= current.timestamp:
+                latest[order_book.symbol] = order_book
+        return True
+    
+    def store_trades(self, trades: TradeBatch, collection_name: str = "trades") -> TradeBatch:
+        with self._lock:
+            seen = self._trade_ids.setdefault(collection_name, set())
+            rows = []
+            for row, trade_id in enumerate(trades.trade_ids):
+                if trade_id not in seen:
+                    seen.add(trade_id)
+                    rows.append(row)
+            inserted = trades if len(rows) == len(trades) else trades.select(rows)
+            if not inserted:
+                return inserted
+            
+            by_symbol = self._trades.setdefault(collection_name, {})
+            stored = by_symbol.setdefault(trades.symbol, TradeBatch(trades.symbol))
+            oldest_first = inserted[::-1]
+            if not stored or min(inserted.times) >= stored.times[-1]:
+                stored.extend(oldest_first)
+            elif max(inserted.times) <= stored.times[0]:
+                # An older page, as pipelined fetches store them; prepend
+                oldest_first.extend(stored)
+                by_symbol[trades.symbol] = oldest_first
+            else:
+                # A late page; re-sort, keeping arrival order for equal times
+                stored.extend(oldest_first)
+                by_symbol[trades.symbol] = stored.select(sorted(range(len(stored)), key=stored.times.__getitem__))
+        return inserted
+    
+    def latest_order_book(self, symbol: str) -> Optional[OrderBook]:
+        return self._order_books.get("order_books", {}).get(symbol)
+    
+    def newest_trade(self, symbol: str) -> Optional[TradeWatermark]:
+        with self._lock:
+            stored = self._trades.get("trades", {}).get(symbol)
+            if not stored:
+                return None
+            return TradeWatermark(trade_id=stored.trade_ids[-1], time=stored.times[-1])
+    
+    def committed_watermark(self, symbol: str) -> Optional[TradeWatermark]:
+        return self._watermarks.get(symbol)
+    
+    def commit_watermark(self, symbol: str, watermark: TradeWatermark) -> None:
+        self._watermarks[symbol] = watermark
+    
+    def iter_recent_trade_batches(self, symbol: str, limit: int, start: float, batch_size: int):
+        with self._lock:
+            stored = self._trades.get("trades", {}).get(symbol)
+            if not stored:
+                return
+            first = max(bisect_left(stored.times, start), len(stored) - limit)
+            recent = stored[first:][::-1]
+        for offset in range(0, len(recent), batch_size):
+            yield recent[offset:offset + batch_size]
+
+STORAGE_BACKENDS = {
+    "mongo": MongoStorage,
+    "sqlite": SQLiteStorage,
+    "memory": MemoryStorage,
+}
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> StorageBackend:
+    """Process-wide storage backend, built from STORAGE_BACKEND on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND not in STORAGE_BACKENDS:
+                    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}. Expected one of {sorted(STORAGE_BACKENDS)}")
+                _storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+def set_storage(storage: StorageBackend) -> Optional[StorageBackend]:
+    """
+    Replace the process-wide storage backend, e.g. in tests and benchmarks
+    
+    Cached analyses and trade watermarks from the previous backend are
+    dropped. The previous backend is returned and left open.
+    """
+    global _storage
+    with _storage_lock:
+        previous, _storage = _storage, storage
+    _analysis_cache.clear()
+    _trade_watermarks.clear()
+    return previous
+
+def _require_mongo_storage(feature: str) -> None:
+    """Reject MongoDB-only features up front instead of failing to connect"""
+    storage = get_storage()
+    if storage.name != "mongo":
+        raise ValueError(f"{feature} is not available on {storage.name} storage; it reads MongoDB directly")
+
+def _order_book_time(timestamp: str) -> datetime:
+    """Aware datetime of an OrderBook timestamp"""
+    taken_at = datetime.fromisoformat(timestamp)
+    if taken_at.tzinfo is None:
+        taken_at = taken_at.astimezone()  # fetch_order_book stamps local time
+    return taken_at
+
+def _order_book_snapshot(order_book: OrderBook) -> Dict[str, Any]:
+    """Compact order_book_history document for an order book"""
+    return {
+        "t": _order_book_time(order_book.timestamp).astimezone(timezone.utc),
+        "s": order_book.symbol,
+        "p": order_book.match_price,
+        "b": order_book.bid_1.price,
+        "bv": order_book.bid_1.volume,
+        "a": order_book.ask_1.price,
+        "av": order_book.ask_1.volume,
+        "c": order_book.change_percent,
+        "v": order_book.volume
+    }
+
+def store_stock_data(data: Union[OrderBook, TradeBatch, List[Trade]], collection_name: str) -> MongoResult:
+    """Store stock data through the configured storage backend"""
+    result = MongoResult()
+    
+    try:
+        storage = get_storage()
+        
+        # Convert and store data
+        if isinstance(data, OrderBook):
+            with _metrics.span("store", collection=collection_name, storage=storage.name):
+                result.success = storage.store_order_book(data, collection_name)
+            result.inserted_count = 1 if result.success else 0
+            _metrics.count("documents_written", result.inserted_count, collection=collection_name)
+            if result.success:
+                _analysis_cache.invalidate(data.symbol)
+                get_rolling_windows(data.symbol).update_quote(data.bid_1.price, data.ask_1.price)
+                try:
+                    storage.record_order_book_snapshot(data)
+                except Exception as e:
+                    result.error = f"Order book history update failed: {str(e)}"
+            
+        elif isinstance(data, (TradeBatch, list)):
+            if not data:
+                result.success = True
+                return result
+                
+            if isinstance(data, list):
+                data = TradeBatch.from_trades(data)
+            try:
+                with _metrics.span("store", collection=collection_name, storage=storage.name):
+                    inserted = storage.store_trades(data, collection_name)
+                result.success = True
+                result.inserted_count = len(inserted)
+                _metrics.count("documents_written", result.inserted_count, collection=collection_name)
+                _metrics.count("duplicate_trades_skipped", len(data) - result.inserted_count)
+            except Exception as e:
+                # Part of the batch may have been written before the failure
+                _analysis_cache.invalidate(data.symbol)
+                result.success = False
+                result.error = f"Bulk insert failed: {str(e)}"
+                return result
+            
+            if result.inserted_count:
+                _analysis_cache.invalidate(data.symbol)
+            
+            # Fold only the newly inserted trades into the volume profile. A
+            # failure here leaves the trades stored; rebuild_volume_profile
+            # can recover the profile from them.
+            if inserted:
+                get_rolling_windows(data.symbol).add(inserted)
+                try:
+                    storage.update_volume_profile(inserted)
+                except Exception as e:
+                    result.error = f"Volume profile update failed: {str(e)}"
+                
+    except Exception as e:
+        result.error = str(e)
+        
+    return result
+
+# Per-day volume profile counters, volumes then values, each indexed by
+# SIDE_* code. After-hour volume is stored unclassified because its buy/sell
+# side depends on the bid/ask at analysis time.
+PROFILE_COUNTERS = (
+    "buy_volume",
+    "sell_volume",
+    "after_hour_volume",
+    "buy_value",
+    "sell_value",
+    "after_hour_value",
+    "total_trades"
+)
+
+_TZ_OFFSET_SECONDS = TZINFO.utcoffset(None).total_seconds()
+
+def trading_day(timestamp: float) -> str:
+    """Calendar day (YYYY-MM-DD) of an epoch timestamp in the configured timezone"""
+    return datetime.fromtimestamp(timestamp, tz=TZINFO).strftime("%Y-%m-%d")
+
+def _profile_increments(trades: TradeBatch) -> Dict[tuple, list]:
+    """Sum a batch into {(day, price): [PROFILE_COUNTERS..., first_time, last_time]}"""
+    day_names: Dict[int, str] = {}
+    levels: Dict[tuple, list] = {}
+    for price, volume, side, trade_time in zip(trades.prices, trades.volumes, trades.sides, trades.times):
+        # Integer day index avoids a datetime conversion per trade
+        day_index = int((trade_time + _TZ_OFFSET_SECONDS) // 86400)
+        day = day_names.get(day_index)
+        if day is None:
+            day = day_names[day_index] = trading_day(trade_time)
+        
+        level = levels.get((day, price))
+        if level is None:
+            level = levels[(day, price)] = [0, 0, 0, 0.0, 0.0, 0.0, 0, trade_time, trade_time]
+        level[side] += volume
+        level[3 + side] += price * volume
+        level[6] += 1
+        level[7] = min(level[7], trade_time)
+        level[8] = max(level[8], trade_time)
+    return levels
+
+def update_volume_profile(trades: TradeBatch) -> int:
+    """
+    Add newly ingested trades to the symbol's per-day volume profile
+    
+    Trades are pre-summed per (day, price) so each batch costs one $inc
+    upsert per touched price level, not one per trade.
+    
+    Returns:
+        int: Number of price levels touched
+    """
+    levels = _profile_increments(trades)
+    if not levels:
+        return 0
+    
+    operations = [
+        pymongo.UpdateOne(
+            {"symbol": trades.symbol, "day": day, "price": price},
+            {
+                "$inc": dict(zip(PROFILE_COUNTERS, counters[:7])),
+                "$min": {"first_time": counters[7]},
+                "$max": {"last_time": counters[8]}
+            },
+            upsert=True
+        )
+        for (day, price), counters in levels.items()
+    ]
+    with _metrics.span("mongo_bulk_write", collection="volume_profiles"):
+        get_database().volume_profiles.bulk_write(operations, ordered=False)
+    _metrics.count("documents_written", len(operations), collection="volume_profiles")
+    return len(operations)
+
+def rebuild_volume_profile(symbol: str, start_day: date, end_day: Optional[date] = None) -> int:
+    """
+    Recompute a symbol's volume profile from raw trades, e.g. after a backfill
+    
+    Args:
+        symbol: Stock symbol
+        start_day: First day to rebuild
+        end_day: Last day to rebuild, inclusive (defaults to start_day)
+        
+    Returns:
+        int: Number of price levels written
+    """
+    _require_mongo_storage("Rebuilding the volume profile")
+    end_day = end_day or start_day
+    db = get_database()
+    written = 0
+    
+    day = start_day
+    while day <= end_day:
+        day_start = datetime.combine(day, datetime.min.time(), tzinfo=TZINFO).timestamp()
+        side_code = {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$side", "bu"]}, "then": SIDE_BUY},
+                {"case": {"$eq": ["$side", "sd"]}, "then": SIDE_SELL}
+            ],
+            "default": SIDE_AFTER_HOUR
+        }}
+        group: Dict[str, Any] = {"_id": "$price"}
+        for code in (SIDE_BUY, SIDE_SELL, SIDE_AFTER_HOUR):
+            in_side = {"$eq": ["$side_code", code]}
+            group[PROFILE_COUNTERS[code]] = {"$sum": {"$cond": [in_side, "$volume", 0]}}
+            group[PROFILE_COUNTERS[3 + code]] = {"$sum": {"$cond": [in_side, {"$multiply": ["$price", "$volume"]}, 0]}}
+        group["total_trades"] = {"$sum": 1}
+        group["first_time"] = {"$min": "$time"}
+        group["last_time"] = {"$max": "$time"}
+        
+        with _metrics.span("mongo_aggregate", stage="rebuild_volume_profile"):
+            levels = list(db.trades.aggregate([
+                {"$match": {"symbol": symbol, "time": {"$gte": day_start, "$lt": day_start + 86400}}},
+                {"$project": {"_id": 0, "price": 1, "volume": 1, "time": 1, "side_code": side_code}},
+                {"$group": group}
+            ]))
+        
+        day_name = day.isoformat()
+        with _metrics.span("mongo_delete_many", collection="volume_profiles"):
+            db.volume_profiles.delete_many({"symbol": symbol, "day": day_name})
+        if levels:
+            with _metrics.span("mongo_insert_many", collection="volume_profiles"):
+                db.volume_profiles.insert_many([
+                    {"symbol": symbol, "day": day_name, "price": level.pop("_id"), **level}
+                    for level in levels
+                ])
+            _metrics.count("documents_written", len(levels), collection="volume_profiles")
+        written += len(levels)
+        day += timedelta(days=1)
+    
+    return written
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by threads and asyncio tasks
+    
+    Tokens refill continuously at `rate` per second up to `capacity`; each
+    API request takes one token and waits only when the bucket is empty.
+    """
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller must wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+    
+    def acquire(self) -> None:
+        """Block the calling thread until a token is available"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self) -> None:
+        """Wait without blocking the event loop until a token is available"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# Global limiter for every request made to API_BASE_URL
+_rate_limiter = TokenBucket(API_RATE_LIMIT, API_RATE_BURST)
+
+# Process-wide HTTP session for API_BASE_URL, rebuilt after fork like the
+# MongoDB client so children never share the parent's sockets
+_http_session: Optional[requests.Session] = None
+_http_session_pid: Optional[int] = None
+_http_session_lock = threading.Lock()
+
+def _build_retry() -> Retry:
+    """Retry policy for idempotent API GETs: exponential backoff with jitter"""
+    options = dict(
+        total=API_MAX_RETRIES,
+        backoff_factor=API_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    try:
+        return Retry(backoff_max=API_BACKOFF_MAX, backoff_jitter=API_BACKOFF_FACTOR, **options)
+    except TypeError:  # urllib3 < 2 has neither backoff_max nor backoff_jitter
+        return Retry(**options)
+
+def get_http_session() -> requests.Session:
+    """Return the shared keep-alive session for the market-data API"""
+    global _http_session, _http_session_pid
+    
+    pid = os.getpid()
+    session = _http_session
+    if session is not None and _http_session_pid == pid:
+        return session
+    
+    with _http_session_lock:
+        if _http_session is None or _http_session_pid != pid:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=API_POOL_SIZE,
+                max_retries=_build_retry()
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+            _http_session_pid = pid
+        return _http_session
+
+def close_http_session() -> None:
+    """Close the shared HTTP session; the next request opens a new one"""
+    global _http_session, _http_session_pid
+    
+    with _http_session_lock:
+        session, owner_pid = _http_session, _http_session_pid
+        _http_session = None
+        _http_session_pid = None
+    
+    if session is not None and owner_pid == os.getpid():
+        session.close()
+
+def _reset_http_session_after_fork() -> None:
+    """Drop the inherited HTTP session in a forked child"""
+    global _http_session, _http_session_pid, _http_session_lock
+    _http_session = None
+    _http_session_pid = None
+    _http_session_lock = threading.Lock()
+
+atexit.register(close_http_session)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_http_session_after_fork)
+
+def api_get(path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    GET a market-data API endpoint and return the decoded JSON body
+    
+    Requests are paced by the global rate limiter, reuse pooled keep-alive
+    connections, and are retried on connection errors and RETRY_STATUS_CODES.
+    
+    Args:
+        path: Endpoint path relative to API_BASE_URL
+        params: Query string parameters
+    """
+    _rate_limiter.acquire()
+    endpoint = _endpoint_label(path)
+    with _metrics.span("http_request", endpoint=endpoint):
+        response = get_http_session().get(
+            f"{API_BASE_URL}{path}",
+            params=params,
+            timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+        )
+        response.raise_for_status()
+        body = response.json()
+    # Decoded body size: gzip-encoded responses are smaller on the wire
+    _metrics.count("http_body_bytes", len(response.content), endpoint=endpoint)
+    return body
+
+def _endpoint_label(path: str) -> str:
+    """Low-cardinality metric label for an API path, e.g. "v2/stock" for /v2/stock/VIC"""
+    return "/".join(path.strip("/").split("/")[:2])
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Seconds to wait before retry number `attempt` (0-based)"""
+    if retry_after:
+        try:
+            return min(float(retry_after), API_BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = min(API_BACKOFF_MAX, API_BACKOFF_FACTOR * (2 ** attempt))
+    return delay + random.uniform(0, API_BACKOFF_FACTOR)
+
+async def async_api_get(
+    session: "aiohttp.ClientSession",
+    path: str,
+    params: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Async counterpart of api_get with the same pacing and retry policy"""
+    endpoint = _endpoint_label(path)
+    attempt = 0
+    while True:
+        await _rate_limiter.acquire_async()
+        try:
+            with _metrics.span("http_request", endpoint=endpoint):
+                async with session.get(f"{API_BASE_URL}{path}", params=params) as response:
+                    if response.status in RETRY_STATUS_CODES and attempt < API_MAX_RETRIES:
+                        delay = _backoff_delay(attempt, response.headers.get("Retry-After"))
+                    else:
+                        response.raise_for_status()
+                        body = await response.read()
+                        _metrics.count("http_body_bytes", len(body), endpoint=endpoint)
+                        return json.loads(body)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt >= API_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt)
+        _metrics.count("http_retries", endpoint=endpoint)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+def _parse_order_book(symbol: str, data: Dict[str, Any]) -> OrderBook:
+    """Build an OrderBook from a /v2/stock/{symbol} payload"""
+    return OrderBook(
+        symbol=symbol,
+        timestamp=datetime.now().isoformat(),
+        match_price=data.get("mp"),
+        bid_1=OrderBookLevel(
+            price=data.get("b1"),
+            volume=data.get("b1v")
+        ),
+        ask_1=OrderBookLevel(
+            price=data.get("o1"),
+            volume=data.get("o1v")
+        ),
+        change_percent=data.get("lpcp"),
+        volume=data.get("lv"),
+        depth=OrderBookDepth.from_payload(data)
+    )
+
+# "HH:MM:SS" -> seconds since midnight. Filled lazily; there are only
+# 86,400 possible keys, so it stays small.
+_clock_seconds: Dict[str, int] = {}
+
+def parse_clock(clock: str) -> int:
+    """Seconds since midnight for an "HH:MM:SS" trade time"""
+    seconds = _clock_seconds.get(clock)
+    if seconds is None:
+        digits = clock[0:2] + clock[3:5] + clock[6:8]
+        # int() alone would accept signs and spaces, e.g. "-1:00:00"
+        if len(clock) != 8 or clock[2] != ":" or clock[5] != ":" or not (digits.isascii() and digits.isdigit()):
+            raise ValueError(f"Invalid trade time: {clock!r}")
+        hours, minutes, secs = int(clock[0:2]), int(clock[3:5]), int(clock[6:8])
+        if hours > 23 or minutes > 59 or secs > 59:
+            raise ValueError(f"Invalid trade time: {clock!r}")
+        seconds = _clock_seconds[clock] = hours * 3600 + minutes * 60 + secs
+    return seconds
+
+class SessionClock:
+    """
+    Converts /le-table "HH:MM:SS" times to epoch seconds for one fetch
+    
+    The trading day's midnight is resolved once, in the configured
+    timezone. Times later than now (plus CLOCK_SKEW of slack for the API's
+    clock) belong to the previous day, which happens when a fetch shortly
+    after midnight pages back into yesterday's trades.
+    """
+    CLOCK_SKEW = 300  # Seconds
+    
+    __slots__ = ("day_start", "latest")
+    
+    def __init__(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.day_start = datetime.fromtimestamp(now, tz=TZINFO).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ).timestamp()
+        self.latest = now - self.day_start + self.CLOCK_SKEW
+    
+    def epoch(self, clock: str) -> float:
+        """Epoch seconds of an "HH:MM:SS" time on the current trading day"""
+        seconds = parse_clock(clock)
+        if seconds > self.latest:
+            seconds -= 86400
+        return self.day_start + seconds
+
+def _collect_trades(
+    items: List[Dict[str, Any]],
+    trades: TradeBatch,
+    since: Optional[TradeWatermark],
+    clock: SessionClock
+) -> bool:
+    """
+    Append a /le-table page to `trades`
+    
+    Returns:
+        bool: True if the page reached trades that are already stored
+    """
+    for item in items:
+        trade_time = clock.epoch(item["time"])
+        if since and (item["_id"] == since.trade_id or trade_time < since.time):
+            return True
+        trades.append(
+            item["_id"],
+            item["price"],
+            item["vol"],
+            SIDE_CODES.get(item.get("side"), SIDE_AFTER_HOUR),
+            trade_time
+        )
+    return False
+
+def _trades_page_params(symbol: str, fetched: int, last_id: Optional[str]) -> Dict[str, Any]:
+    """Request parameters for the next /le-table page"""
+    params = {
+        "stockSymbol": symbol,
+        "pageSize": min(PAGE_SIZE, TRADES_TO_FETCH - fetched)
+    }
+    if last_id:
+        params["lastId"] = last_id
+    return params
+
+def fetch_order_book(symbol) -> OrderBook:
+    """Fetch current order book data for a symbol"""
+    payload = api_get(f"/v2/stock/{symbol}")
+    return _parse_order_book(symbol, payload.get("data", {}))
+
+def fetch_trades(symbol: str, since: Optional[TradeWatermark] = None) -> TradeBatch:
+    """
+    Fetch specified number of trades for a symbol using lastId pagination
+    
+    Args:
+        symbol: Stock symbol
+        since: Newest trade already stored; pagination stops once it is reached
+        
+    Returns:
+        TradeBatch: Trades newer than `since`, newest first
+    """
+    trades = TradeBatch(symbol)
+    clock = SessionClock()
+    for items in _iter_trade_pages(symbol, since, clock):
+        # Convert items until we reach already stored trades
+        if _collect_trades(items, trades, since, clock):
+            break
+    
+    return trades[:TRADES_TO_FETCH]  # Ensure we don't return more than requested
+
+def _iter_trade_pages(symbol: str, since: Optional[TradeWatermark], clock: SessionClock):
+    """
+    Yield raw /le-table pages, newest first, until TRADES_TO_FETCH items or
+    the first already stored trade
+    
+    Only the page's last item is parsed here, so the next request goes out
+    as soon as the previous response is decoded.
+    """
+    fetched = 0
+    last_id = None
+    while fetched < TRADES_TO_FETCH:
+        # Make API request on the shared session
+        payload = api_get("/le-table", params=_trades_page_params(symbol, fetched, last_id))
+        
+        # Process response
+        items = payload.get("data", {}).get("items", [])
+        if not items:  # No more trades available
+            return
+        _metrics.count("trade_pages_fetched")
+        yield items
+        
+        # Pages are newest first: this one reached stored trades if it holds
+        # the watermark trade or ends before it
+        if since and (
+            clock.epoch(items[-1]["time"]) < since.time
+            or any(item["_id"] == since.trade_id for item in items)
+        ):
+            return
+        fetched += len(items)
+        last_id = items[-1]["_id"]
+
+def fetch_and_store_trades(symbol: str, since: Optional[TradeWatermark] = None) -> TradesResult:
+    """
+    Fetch new trades and store them while later pages are still in flight
+    
+    The calling thread only makes requests: each page is handed to a
+    writer thread through a queue of FETCH_PIPELINE_DEPTH pages, and the
+    next request goes out immediately. The writer converts pages and
+    stores them in batches of TRADE_WRITE_BATCH_SIZE, newest first, so the
+    whole fetch costs about one round-trip per page and memory stays
+    bounded however many trades are fetched. Because batches are stored
+    newest first, the symbol's watermark is committed to storage only
+    after the whole fetch is stored. After a failed store or request,
+    the next poll, in this process or after a restart, refetches from the
+    previously committed watermark and skips trades already stored.
+    
+    Args:
+        symbol: Stock symbol
+        since: Newest trade already stored; pagination stops once it is reached
+        
+    Returns:
+        TradesResult: Totals over all stored batches; the first error, if any
+    """
+    clock = SessionClock()
+    pages: queue.Queue = queue.Queue(maxsize=FETCH_PIPELINE_DEPTH)
+    result = TradesResult(success=True)
+    newest: List[TradeWatermark] = []
+    writer_failed = threading.Event()
+    
+    def flush(batch: TradeBatch) -> None:
+        if not batch:
+            return
+        if not newest:
+            newest.append(TradeWatermark(trade_id=batch.trade_ids[0], time=batch.times[0]))
+        _metrics.count("trades_fetched", len(batch))
+        stored = store_stock_data(batch, "trades")
+        result.trades_fetched += len(batch)
+        result.inserted_count += stored.inserted_count
+        if not stored.success:
+            result.success = False
+        if stored.error and not result.error:
+            result.error = stored.error
+    
+    def write() -> None:
+        batch = TradeBatch(symbol)
+        collected = 0
+        done = False
+        while True:
+            items = pages.get()
+            if items is None:
+                break
+            if done:
+                continue  # Drain pages fetched before the fetcher saw the stop
+            try:
+                reached_stored = _collect_trades(items, batch, since, clock)
+                if collected + len(batch) >= TRADES_TO_FETCH:
+                    batch = batch[:TRADES_TO_FETCH - collected]
+                    done = True
+                done = done or reached_stored
+                if done or len(batch) >= TRADE_WRITE_BATCH_SIZE:
+                    collected += len(batch)
+                    flush(batch)
+                    batch = TradeBatch(symbol)
+            except Exception as e:
+                result.success = False
+                result.error = result.error or str(e)
+                writer_failed.set()
+                done = True
+        if not done:
+            flush(batch)
+    
+    writer = threading.Thread(target=write, name=f"trade-writer-{symbol}", daemon=True)
+    writer.start()
+    try:
+        for items in _iter_trade_pages(symbol, since, clock):
+            if writer_failed.is_set():
+                break
+            pages.put(items)
+    finally:
+        pages.put(None)
+        writer.join()
+    
+    # Later batches are older, so after a failure the newest stored trade
+    # may sit above a gap; the committed watermark stays where it was
+    if result.success and newest:
+        _commit_trade_watermark(symbol, newest[0], result)
+    return result
+
+async def async_fetch_order_book(session: "aiohttp.ClientSession", symbol: str) -> OrderBook:
+    """Fetch current order book data for a symbol on a shared aiohttp session"""
+    payload = await async_api_get(session, f"/v2/stock/{symbol}")
+    return _parse_order_book(symbol, payload.get("data", {}))
+
+async def async_fetch_trades(
+    session: "aiohttp.ClientSession",
+    symbol: str,
+    since: Optional[TradeWatermark] = None
+) -> TradeBatch:
+    """Async counterpart of fetch_trades, sharing its pagination and stop rules"""
+    trades = TradeBatch(symbol)
+    clock = SessionClock()
+    last_id = None
+    reached_stored = False
+    
+    while len(trades) < TRADES_TO_FETCH and not reached_stored:
+        params = _trades_page_params(symbol, len(trades), last_id)
+        payload = await async_api_get(session, "/le-table", params=params)
+        
+        items = payload.get("data", {}).get("items", [])
+        if not items:
+            break
+        
+        _metrics.count("trade_pages_fetched")
+        reached_stored = _collect_trades(items, trades, since, clock)
+        last_id = items[-1]["_id"]
+    
+    return trades[:TRADES_TO_FETCH]
+
+def get_trade_watermark(symbol: str) -> Optional[TradeWatermark]:
+    """
+    Get the trade up to which a symbol's trades are all stored, from cache or storage
+    
+    Seeded from the storage backend's committed watermark. A symbol without
+    one (never fetched, or stored before watermarks were committed) starts
+    from its newest stored trade, committed at once so that a fetch failing
+    part-way cannot move it.
+    
+    Returns:
+        Optional[TradeWatermark]: None when no trades are stored yet
+    """
+    watermark = _trade_watermarks.get(symbol)
+    if watermark is None:
+        storage = get_storage()
+        watermark = storage.committed_watermark(symbol)
+        if watermark is None:
+            watermark = storage.newest_trade(symbol) or _NO_TRADES_WATERMARK
+            storage.commit_watermark(symbol, watermark)
+        _trade_watermarks[symbol] = watermark
+    return watermark if watermark != _NO_TRADES_WATERMARK else None
+
+def _commit_trade_watermark(symbol: str, watermark: TradeWatermark, result: TradesResult) -> None:
+    """Persist and cache a symbol's watermark once a whole fetch is stored; failures go to `result`"""
+    try:
+        get_storage().commit_watermark(symbol, watermark)
+    except Exception as e:
+        result.success = False
+        result.error = f"Watermark commit failed: {e}"
+        return
+    _trade_watermarks[symbol] = watermark
+
+def _store_fetched(symbol: str, order_book: OrderBook, trades: TradeBatch) -> StoreResult:
+    """Store a fetched order book and new trades, advancing the watermark"""
+    _metrics.count("trades_fetched", len(trades))
+    order_book_result = store_stock_data(order_book, "order_books")
+    stored = store_stock_data(trades, "trades")
+    trades_result = TradesResult(
+        success=stored.success,
+        inserted_count=stored.inserted_count,
+        error=stored.error,
+        trades_fetched=len(trades)
+    )
+    if trades_result.success and trades:
+        _commit_trade_watermark(symbol, TradeWatermark(trade_id=trades.trade_ids[0], time=trades.times[0]), trades_result)
+    
+    return StoreResult(order_book=order_book_result, trades=trades_result)
+
+def fetch_and_store_stock_data(symbol: str) -> StoreResult:
+    """
+    Fetch and store both order book and trades data
+    
+    Only trades newer than the symbol's high-water mark are fetched and
+    inserted, so each poll costs in proportion to the new trades.
+    
+    Returns:
+        StoreResult: Results of both operations
+    """
+    started = time.perf_counter()
+    with _metrics.span("fetch_and_store"):
+        order_book_result = store_stock_data(fetch_order_book(symbol), "order_books")
+        trades_result = fetch_and_store_trades(symbol, since=get_trade_watermark(symbol))
+    _metrics.gauge("ingest_trades_per_second", trades_result.trades_fetched / (time.perf_counter() - started), symbol=symbol)
+    return StoreResult(order_book=order_book_result, trades=trades_result)
+
+async def async_fetch_and_store_many(symbols: List[str]) -> Dict[str, StoreResult]:
+    """
+    Fetch and store order books and trades for many symbols concurrently
+    
+    All symbols share one keep-alive connection pool. Up to API_CONCURRENCY
+    symbols are in flight at once and every request is paced by the global
+    token bucket. Blocking MongoDB calls run in worker threads. A failure for
+    one symbol is reported in its StoreResult and does not stop the others.
+    
+    Args:
+        symbols: Stock symbols to refresh
+        
+    Returns:
+        Dict[str, StoreResult]: Results keyed by symbol
+    """
+    if aiohttp is None:
+        raise ImportError("aiohttp is required for the async ingestion pipeline")
+    
+    semaphore = asyncio.Semaphore(API_CONCURRENCY)
+    
+    async def refresh(session: "aiohttp.ClientSession", symbol: str) -> StoreResult:
+        async with semaphore:
+            try:
+                started = time.perf_counter()
+                with _metrics.span("fetch_and_store"):
+                    since = await asyncio.to_thread(get_trade_watermark, symbol)
+                    order_book, trades = await asyncio.gather(
+                        async_fetch_order_book(session, symbol),
+                        async_fetch_trades(session, symbol, since)
+                    )
+                    result = await asyncio.to_thread(_store_fetched, symbol, order_book, trades)
+                _metrics.gauge("ingest_trades_per_second", len(trades) / (time.perf_counter() - started), symbol=symbol)
+                return result
+            except Exception as e:
+                return StoreResult(
+                    order_book=MongoResult(error=str(e)),
+                    trades=TradesResult(error=str(e))
+                )
+    
+    connector = aiohttp.TCPConnector(limit=API_POOL_SIZE, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(sock_connect=API_CONNECT_TIMEOUT, sock_read=API_READ_TIMEOUT)
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+        results = await asyncio.gather(*(refresh(session, symbol) for symbol in symbols))
+    return dict(zip(symbols, results))
+
+def fetch_and_store_many(symbols: List[str]) -> Dict[str, StoreResult]:
+    """Blocking wrapper around async_fetch_and_store_many"""
+    return asyncio.run(async_fetch_and_store_many(symbols))
+
+def get_latest_order_book(symbol: str) -> Optional[OrderBook]:
+    """Get the latest stored order book"""
+    return get_storage().latest_order_book(symbol)
+
+def _order_book_from_doc(doc: Dict[str, Any]) -> OrderBook:
+    """Build an OrderBook from a stored order_books document"""
+    return OrderBook(
+        symbol=doc["symbol"],
+        timestamp=doc["timestamp"],
+        match_price=doc["match_price"],
+        bid_1=OrderBookLevel(**doc["bid_1"]),
+        ask_1=OrderBookLevel(**doc["ask_1"]),
+        change_percent=doc["change_percent"],
+        volume=doc["volume"],
+        depth=OrderBookDepth.from_doc(doc["depth"]) if doc.get("depth") else None
+    )
+
+def get_latest_order_books(symbols: List[str]) -> Dict[str, OrderBook]:
+    """Get the latest order book of every symbol (one aggregation on MongoDB)"""
+    return get_storage().latest_order_books(symbols)
+
+def get_order_book_history(
+    symbol: str,
+    start: float,
+    end: Optional[float] = None,
+    interval: Optional[float] = None
+) -> Dict[str, List]:
+    """
+    Get the top-of-book history of a symbol over a time window
+    
+    With `interval`, snapshots are downsampled server-side into fixed
+    buckets: prices are the last in each bucket and volumes the largest, so
+    a wall that sat on the book for part of a bucket still shows.
+    
+    Args:
+        symbol: Stock symbol
+        start: Window start, epoch seconds
+        end: Window end, epoch seconds (defaults to now)
+        interval: Bucket width in seconds (defaults to every snapshot)
+        
+    Returns:
+        Dict[str, List]: Columns time (epoch seconds), match_price,
+        bid_price, bid_volume, ask_price and ask_volume, oldest first
+    """
+    _require_mongo_storage("Order book history")
+    time_range = {"$gte": datetime.fromtimestamp(start, timezone.utc)}
+    if end is not None:
+        time_range["$lte"] = datetime.fromtimestamp(end, timezone.utc)
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {"s": symbol, "t": time_range}},
+        {"$sort": {"t": 1}}
+    ]
+    if interval:
+        bucket_ms = int(interval * 1000)
+        epoch_ms = {"$subtract": ["$t", datetime(1970, 1, 1)]}  # Naive dates are UTC to BSON
+        pipeline += [
+            {"$group": {
+                "_id": {"$subtract": [epoch_ms, {"$mod": [epoch_ms, bucket_ms]}]},
+                "p": {"$last": "$p"},
+                "b": {"$last": "$b"},
+                "bv": {"$max": "$bv"},
+                "a": {"$last": "$a"},
+                "av": {"$max": "$av"}
+            }},
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "t": {"$divide": ["$_id", 1000]}, "p": 1, "b": 1, "bv": 1, "a": 1, "av": 1}}
+        ]
+    else:
+        pipeline.append({"$project": {"_id": 0, "t": 1, "p": 1, "b": 1, "bv": 1, "a": 1, "av": 1}})
+    
+    history: Dict[str, List] = {
+        "time": [], "match_price": [], "bid_price": [], "bid_volume": [], "ask_price": [], "ask_volume": []
+    }
+    for doc in get_database()[ORDER_BOOK_HISTORY].aggregate(pipeline):
+        taken_at = doc["t"]
+        if isinstance(taken_at, datetime):
+            # pymongo returns naive UTC dates
+            taken_at = taken_at.replace(tzinfo=timezone.utc).timestamp()
+        history["time"].append(taken_at)
+        history["match_price"].append(doc["p"])
+        history["bid_price"].append(doc["b"])
+        history["bid_volume"].append(doc["bv"])
+        history["ask_price"].append(doc["a"])
+        history["ask_volume"].append(doc["av"])
+    return history
+
+def _lookback_start(days: Optional[int] = None) -> float:
+    """Epoch of local midnight `days` days ago (defaults to DAYS_TO_FETCH)"""
+    # Use provided days or fall back to environment variable
+    days_to_fetch = days if days is not None else DAYS_TO_FETCH
+    
+    # Calculate the timestamp for N days ago using configured timezone
+    now = datetime.now(TZINFO)
+    days_ago = now - timedelta(days=days_to_fetch)
+    return days_ago.replace(
+        hour=0, 
+        minute=0, 
+        second=0, 
+        microsecond=0
+    ).timestamp()
+
+def get_recent_trades(symbol: str, limit: int = 100, days: int = None) -> TradeBatch:
+    """
+    Get recent trades from storage
+    
+    Args:
+        symbol: Stock symbol
+        limit: Maximum number of trades to return
+        days: Number of days to look back (defaults to DAYS_TO_FETCH from env)
+    
+    Returns:
+        TradeBatch: Trades, newest first
+    """
+    trades = TradeBatch(symbol)
+    for chunk in iter_recent_trade_batches(symbol, limit, days):
+        trades.extend(chunk)
+    return trades
+
+def iter_recent_trade_batches(
+    symbol: str,
+    limit: int = 100,
+    days: int = None,
+    batch_size: int = TRADE_CURSOR_BATCH_SIZE
+):
+    """
+    Stream recent trades from storage in TradeBatch chunks
+    
+    Only one chunk (and one cursor batch) is held at a time, so memory stays
+    flat however many trades `limit` and `days` select.
+    
+    Args:
+        symbol: Stock symbol
+        limit: Maximum number of trades to return
+        days: Number of days to look back (defaults to DAYS_TO_FETCH from env)
+        batch_size: Trades per yielded chunk and per cursor round-trip
+    
+    Yields:
+        TradeBatch: Consecutive chunks of trades, newest first
+    """
+    return get_storage().iter_recent_trade_batches(symbol, limit, _lookback_start(days), batch_size)
+
+# Bucket codes used by the columnar engine, in PriceVolumeData field order
+# (buy and sell share their SIDE_* codes)
+BUCKET_BUY, BUCKET_SELL, BUCKET_AFTER_HOUR_BUY, BUCKET_AFTER_HOUR_SELL, BUCKET_AFTER_HOUR_UNKNOWN = range(5)
+BUCKET_VOLUME_FIELDS = ("buy_volume", "sell_volume", "after_hour_buy", "after_hour_sell", "after_hour_unknown")
+BUCKET_VALUE_FIELDS = (
+    "buy_value",
+    "sell_value",
+    "after_hour_buy_value",
+    "after_hour_sell_value",
+    "after_hour_unknown_value"
+)
+
+def _finalize_levels(price_volumes: Dict[float, PriceVolumeData]) -> Dict[float, PriceVolumeData]:
+    """Fill in the totals and imbalances derived from the per-side counters"""
+    for price_data in price_volumes.values():
+        price_data.total_volume = (
+            price_data.buy_volume + 
             price_data.sell_volume + 
             price_data.after_hour_buy +
             price_data.after_hour_sell +
@@ -488,67 +2535,397 @@ def analyze_volume_at_price(trades: List[Trade], order_book: OrderBook) -> Dict[
     
     return price_volumes
 
-def analyze_stock_data(symbol: str, days: int = None) -> dict:
-    """Analyze stock data including volume and value analysis"""
-    order_book = get_latest_order_book(symbol)
-    trades = get_recent_trades(symbol, limit=TRADES_TO_FETCH, days=days)
+def _levels_from_counters(
+    prices: List[float],
+    volumes: List[List[int]],
+    values: List[List[float]],
+    trade_counts: List[int],
+    last_times: List[float]
+) -> Dict[float, PriceVolumeData]:
+    """Build finalized PriceVolumeData levels from per-bucket counters"""
+    price_volumes: Dict[float, PriceVolumeData] = {}
+    for price, level_volumes, level_values, count, last_time in zip(prices, volumes, values, trade_counts, last_times):
+        fields = dict(zip(BUCKET_VOLUME_FIELDS, level_volumes))
+        fields.update(zip(BUCKET_VALUE_FIELDS, level_values))
+        price_volumes[price] = PriceVolumeData(
+            total_trades=count,
+            last_trade_time=format_trade_time(last_time),
+            last_time=last_time,
+            **fields
+        )
+    return _finalize_levels(price_volumes)
+
+# Per-batch aggregation engines. Both return parallel lists of
+# (prices, volumes per bucket, values per bucket, trade counts, newest trade
+# time, oldest row index) per price level, where the row index counts from
+# the start of the newest-first batch.
+
+def _aggregate_batch_python(trades: TradeBatch, bid_price: float, ask_price: float) -> tuple:
+    """Per-trade aggregation over plain counters, used when NumPy is not installed"""
+    # price -> [volumes per bucket, values per bucket, trade count, newest time, oldest row]
+    levels: Dict[float, list] = {}
+    row = len(trades)
     
-    if not order_book:
-        raise ValueError("No order book data available")
+    for price, volume, side, trade_time in zip(
+        reversed(trades.prices), reversed(trades.volumes), reversed(trades.sides), reversed(trades.times)
+    ):
+        row -= 1
+        level = levels.get(price)
+        if level is None:
+            level = levels[price] = [[0] * 5, [0.0] * 5, 0, trade_time, row]
+        
+        # after-hour trade classification
+        if side == SIDE_AFTER_HOUR:
+            if price >= ask_price:
+                bucket = BUCKET_AFTER_HOUR_BUY
+            elif price <= bid_price:
+                bucket = BUCKET_AFTER_HOUR_SELL
+            else:
+                bucket = BUCKET_AFTER_HOUR_UNKNOWN
+        else:
+            bucket = side
+        
+        level[0][bucket] += volume
+        level[1][bucket] += price * volume
+        level[2] += 1
+        if trade_time > level[3]:
+            level[3] = trade_time
+    
+    return (
+        list(levels),
+        [level[0] for level in levels.values()],
+        [level[1] for level in levels.values()],
+        [level[2] for level in levels.values()],
+        [level[3] for level in levels.values()],
+        [level[4] for level in levels.values()]
+    )
+
+def _aggregate_batch_numpy(trades: TradeBatch, bid_price: float, ask_price: float) -> tuple:
+    """
+    Columnar aggregation over NumPy views of the batch
+    
+    Trades are processed oldest first like the per-trade loop, so every
+    per-level sum accumulates in the same order.
+    """
+    n = len(trades)
+    prices, volumes, sides, times = trades.columns()
+    price = prices[::-1]
+    volume = volumes[::-1]
+    side = sides[::-1].astype(np.int64)
+    trade_time = times[::-1]
+    value = price * volume
+    
+    # Classify after-hour trades against the current bid/ask in one pass
+    bucket = np.where(
+        side == SIDE_AFTER_HOUR,
+        np.select(
+            [price >= ask_price, price <= bid_price],
+            [BUCKET_AFTER_HOUR_BUY, BUCKET_AFTER_HOUR_SELL],
+            default=BUCKET_AFTER_HOUR_UNKNOWN
+        ),
+        side
+    )
     
-    # Analyze volumes at each price level
-    price_volumes = analyze_volume_at_price(trades, order_book)
+    # Group by price level: one bincount per measure over (level, bucket) slots
+    levels, first_index, level_index = np.unique(price, return_index=True, return_inverse=True)
+    n_levels = len(levels)
+    slot = level_index * 5 + bucket
+    level_volumes = np.bincount(slot, weights=volume, minlength=n_levels * 5).reshape(n_levels, 5)
+    level_values = np.bincount(slot, weights=value, minlength=n_levels * 5).reshape(n_levels, 5)
+    trade_counts = np.bincount(level_index, minlength=n_levels)
     
-    # Sort prices for significant levels
-    sorted_levels = sorted(
-        [(price, data) for price, data in price_volumes.items()],
-        key=lambda x: x[1].total_value,
-        reverse=True
+    # Newest trade time per level, formatted once per level later
+    last_times = np.full(n_levels, -np.inf)
+    np.maximum.at(last_times, level_index, trade_time)
+    
+    return (
+        levels.tolist(),
+        level_volumes.astype(np.int64).tolist(),
+        level_values.tolist(),
+        trade_counts.tolist(),
+        last_times.tolist(),
+        (n - 1 - first_index).tolist()
     )
+
+class PriceLevelAccumulator:
+    """
+    Incremental price-level aggregation over newest-first TradeBatch chunks
     
-    # Get top 5 levels
-    significant_levels = [
-        {
-            "price": price,
-            "buy_volume": data.buy_volume,
-            "sell_volume": data.sell_volume,
-            "after_hour_buy": data.after_hour_buy,
-            "after_hour_sell": data.after_hour_sell,
-            "after_hour_unknown": data.after_hour_unknown,
-            "buy_value": data.buy_value,
-            "sell_value": data.sell_value,
-            "after_hour_buy_value": data.after_hour_buy_value,
-            "after_hour_sell_value": data.after_hour_sell_value,
-            "after_hour_unknown_value": data.after_hour_unknown_value,
-            "total_volume": data.total_volume,
-            "total_value": data.total_value,
-            "volume_imbalance": data.volume_imbalance,
-            "value_imbalance": data.value_imbalance,
-            "total_trades": data.total_trades,
-            "last_trade_time": data.last_trade_time
-        }
-        for price, data in sorted_levels[:5]
-    ]
+    Each chunk is aggregated on its own and merged into running per-level
+    counters, so trades can be streamed straight off a cursor. For a single
+    chunk the result is exactly analyze_volume_at_price's; over many chunks
+    only the float summation order differs.
+    """
+    
+    def __init__(self, order_book: OrderBook):
+        self.bid_price = order_book.bid_1.price
+        self.ask_price = order_book.ask_1.price
+        self.total_trades = 0
+        # price -> [volumes per bucket, values per bucket, trade count, newest time, oldest row]
+        self._levels: Dict[float, list] = {}
+    
+    def add(self, trades: TradeBatch) -> None:
+        """Fold the next (older) chunk of trades into the running levels"""
+        if not trades:
+            return
+        aggregate = _aggregate_batch_numpy if np is not None else _aggregate_batch_python
+        offset = self.total_trades
+        for price, volumes, values, count, last_time, oldest_row in zip(
+            *aggregate(trades, self.bid_price, self.ask_price)
+        ):
+            level = self._levels.get(price)
+            if level is None:
+                self._levels[price] = [volumes, values, count, last_time, offset + oldest_row]
+                continue
+            for bucket in range(5):
+                level[0][bucket] += volumes[bucket]
+                level[1][bucket] += values[bucket]
+            level[2] += count
+            level[3] = max(level[3], last_time)
+            level[4] = offset + oldest_row
+        self.total_trades += len(trades)
+    
+    def price_volumes(self) -> Dict[float, PriceVolumeData]:
+        """Finalized levels, ordered by first appearance in time"""
+        ordered = sorted(self._levels.items(), key=lambda item: item[1][4], reverse=True)
+        return _levels_from_counters(
+            [price for price, _ in ordered],
+            [level[0] for _, level in ordered],
+            [level[1] for _, level in ordered],
+            [level[2] for _, level in ordered],
+            [level[3] for _, level in ordered]
+        )
+
+def analyze_volume_at_price(
+    trades: Union[TradeBatch, List[Trade]],
+    order_book: OrderBook
+) -> Dict[float, PriceVolumeData]:
+    """Analyze accumulated volume and value at each price level"""
+    if isinstance(trades, list):
+        trades = TradeBatch.from_trades(trades)
+    accumulator = PriceLevelAccumulator(order_book)
+    accumulator.add(trades)
+    return accumulator.price_volumes()
+
+def _summarize_levels(price_volumes: Dict[float, PriceVolumeData]) -> PriceVolumeData:
+    """Sum the per-side counters of every price level"""
+    totals = PriceVolumeData()
+    for data in price_volumes.values():
+        for field in BUCKET_VOLUME_FIELDS + BUCKET_VALUE_FIELDS:
+            setattr(totals, field, getattr(totals, field) + getattr(data, field))
+        totals.total_trades += data.total_trades
+    return _finalize_levels({0.0: totals})[0.0]
+
+def _level_summary(price: float, data: PriceVolumeData) -> Dict[str, Any]:
+    """Flatten a price level for the significant_levels list"""
+    return {
+        "price": price,
+        "buy_volume": data.buy_volume,
+        "sell_volume": data.sell_volume,
+        "after_hour_buy": data.after_hour_buy,
+        "after_hour_sell": data.after_hour_sell,
+        "after_hour_unknown": data.after_hour_unknown,
+        "buy_value": data.buy_value,
+        "sell_value": data.sell_value,
+        "after_hour_buy_value": data.after_hour_buy_value,
+        "after_hour_sell_value": data.after_hour_sell_value,
+        "after_hour_unknown_value": data.after_hour_unknown_value,
+        "total_volume": data.total_volume,
+        "total_value": data.total_value,
+        "volume_imbalance": data.volume_imbalance,
+        "value_imbalance": data.value_imbalance,
+        "total_trades": data.total_trades,
+        "last_trade_time": data.last_trade_time
+    }
+
+def _median(values: List[float]) -> float:
+    """
+    Median by quickselect, in expected linear time (statistics.median sorts)
+    
+    Args:
+        values: Non-empty list of numbers; it is not modified
+        
+    Returns:
+        float: The median, averaging the two middle values for even lengths
+    """
+    def select(items: List[float], k: int) -> float:
+        """k-th smallest (0-based) of items"""
+        while True:
+            pivot = items[random.randrange(len(items))]
+            lows = [item for item in items if item < pivot]
+            if k < len(lows):
+                items = lows
+                continue
+            highs = [item for item in items if item > pivot]
+            equal = len(items) - len(lows) - len(highs)
+            if k < len(lows) + equal:
+                return pivot
+            k -= len(lows) + equal
+            items = highs
+    
+    middle = len(values) // 2
+    if len(values) % 2:
+        return float(select(values, middle))
+    return (select(values, middle - 1) + select(values, middle)) / 2
+
+def detect_volume_walls(
+    price_volumes: Dict[float, PriceVolumeData],
+    current_price: float,
+    volume_multiple: float = WALL_VOLUME_MULTIPLE,
+    band_width: float = WALL_BAND_WIDTH,
+    half_life: float = WALL_RECENCY_HALF_LIFE,
+    max_results: int = WALL_MAX_RESULTS,
+    depth: Optional[OrderBookDepth] = None,
+    depth_weight: float = WALL_DEPTH_WEIGHT
+) -> List[Dict[str, Any]]:
+    """
+    Find volume walls: price bands with unusually heavy accumulated volume
+    
+    Adjacent ticks are clustered into bands of `band_width`. A band is a
+    wall when its volume is at least `volume_multiple` times the median band
+    volume. Walls are scored by that multiple, boosted by their buy/sell
+    imbalance and decayed by the age of their last trade (relative to the
+    newest trade in the profile). Grouping and the median are linear in the
+    number of levels; top-k selection is O(n log max_results).
+    
+    With `depth`, resting order book volume is folded into the same bands
+    at `depth_weight` per share, so a band can be a wall through executed
+    volume, resting orders or both. Resting volume is current and is not
+    decayed. The merge adds one dict lookup per book level.
     
-    # Calculate trading summaries
-    buy_volume = sum(t.volume for t in trades if t.side == "bu")
-    sell_volume = sum(t.volume for t in trades if t.side == "sd")
-    after_hour_trades = [t for t in trades if t.side == "after-hour"]
+    Args:
+        price_volumes: Aggregated price levels (see analyze_volume_at_price)
+        current_price: Latest match price, used to label support/resistance
+        volume_multiple: Minimum band volume as a multiple of the median
+        band_width: Price width of a band; 0 treats every level as a band
+        half_life: Seconds for a wall's recency weight to halve
+        max_results: Maximum number of walls returned
+        depth: Resting order book levels (OrderBook.depth), if captured
+        depth_weight: Weight of a resting share relative to a traded one
+        
+    Returns:
+        List[Dict[str, Any]]: Walls, highest score first
+    """
+    def band_key(price: float) -> float:
+        return math.floor(price / band_width + 1e-9) if band_width > 0 else price
     
-    after_hour_buy = sum(t.volume for t in after_hour_trades if t.price >= order_book.ask_1.price)
-    after_hour_sell = sum(t.volume for t in after_hour_trades if t.price <= order_book.bid_1.price)
-    after_hour_unknown = sum(t.volume for t in after_hour_trades 
-                           if order_book.bid_1.price < t.price < order_book.ask_1.price)
+    # band key -> [low, high, peak price, peak volume, volume, value, buy, sell, trades, newest time,
+    #              resting bid volume, resting ask volume]
+    bands: Dict[float, list] = {}
+    for price, data in price_volumes.items():
+        if not data.total_volume:
+            continue
+        key = band_key(price)
+        last_time = data.last_time
+        if last_time is None:
+            # Levels built by hand carry only the formatted time
+            last_time = datetime.fromisoformat(data.last_trade_time).timestamp() if data.last_trade_time else 0.0
+        band = bands.get(key)
+        if band is None:
+            bands[key] = [
+                price, price, price, data.total_volume, data.total_volume, data.total_value,
+                data.buy_volume + data.after_hour_buy, data.sell_volume + data.after_hour_sell,
+                data.total_trades, last_time, 0, 0
+            ]
+            continue
+        band[0] = min(band[0], price)
+        band[1] = max(band[1], price)
+        if data.total_volume > band[3]:
+            band[2], band[3] = price, data.total_volume
+        band[4] += data.total_volume
+        band[5] += data.total_value
+        band[6] += data.buy_volume + data.after_hour_buy
+        band[7] += data.sell_volume + data.after_hour_sell
+        band[8] += data.total_trades
+        band[9] = max(band[9], last_time)
+    if depth is not None and depth_weight > 0:
+        for prices, volumes, column in (
+            (depth.bid_prices, depth.bid_volumes, 10),
+            (depth.ask_prices, depth.ask_volumes, 11)
+        ):
+            for price, volume in zip(prices, volumes):
+                key = band_key(price)
+                band = bands.get(key)
+                if band is None:
+                    # Resting orders at a price that has not traded
+                    band = bands[key] = [price, price, price, 0, 0, 0.0, 0, 0, 0, 0.0, 0, 0]
+                else:
+                    band[0] = min(band[0], price)
+                    band[1] = max(band[1], price)
+                band[column] += volume
+    if not bands:
+        return []
     
-    buy_value = sum(t.value for t in trades if t.side == "bu")
-    sell_value = sum(t.value for t in trades if t.side == "sd")
-    after_hour_buy_value = sum(t.value for t in after_hour_trades if t.price >= order_book.ask_1.price)
-    after_hour_sell_value = sum(t.value for t in after_hour_trades if t.price <= order_book.bid_1.price)
-    after_hour_unknown_value = sum(t.value for t in after_hour_trades 
-                                 if order_book.bid_1.price < t.price < order_book.ask_1.price)
+    def weight(band: list) -> float:
+        """Traded plus weighted resting volume"""
+        return band[4] + depth_weight * (band[10] + band[11])
+    
+    weights = [weight(band) for band in bands.values()]
+    median = float(np.median(weights)) if np is not None else _median(weights)
+    newest = max(band[9] for band in bands.values())
+    threshold = volume_multiple * median
+    
+    def score(band: list) -> float:
+        recency = 0.5 ** ((newest - band[9]) / half_life) if half_life > 0 else 1.0
+        return ((band[4] + abs(band[6] - band[7])) * recency + depth_weight * (band[10] + band[11])) / median
+    
+    candidates = [band for band in bands.values() if weight(band) >= threshold]
+    walls = []
+    for band in heapq.nlargest(max_results, candidates, key=score):
+        low, high = band[0], band[1]
+        if high < current_price:
+            position = "support"
+        elif low > current_price:
+            position = "resistance"
+        else:
+            position = "at_market"
+        walls.append({
+            "price_low": low,
+            "price_high": high,
+            "peak_price": band[2],
+            "position": position,
+            "total_volume": band[4],
+            "total_value": band[5],
+            "buy_volume": band[6],
+            "sell_volume": band[7],
+            "volume_imbalance": band[6] - band[7],
+            "total_trades": band[8],
+            "resting_bid_volume": band[10],
+            "resting_ask_volume": band[11],
+            "volume_multiple": weight(band) / median,
+            "score": score(band),
+            "last_trade_time": format_trade_time(band[9]) if band[8] else None
+        })
+    return walls
 
-    total_volume = buy_volume + sell_volume + after_hour_buy + after_hour_sell + after_hour_unknown
-    total_value = buy_value + sell_value + after_hour_buy_value + after_hour_sell_value + after_hour_unknown_value
+def _build_analysis_result(
+    symbol: str,
+    order_book: OrderBook,
+    top_levels: List[tuple],
+    bid_level: Optional[PriceVolumeData],
+    ask_level: Optional[PriceVolumeData],
+    totals: PriceVolumeData,
+    unique_price_levels: int,
+    period: Optional[str] = None,
+    volume_walls: Optional[List[Dict[str, Any]]] = None
+) -> dict:
+    """
+    Assemble the analyze_stock_data result from aggregated price levels
+    
+    Args:
+        top_levels: (price, PriceVolumeData) of the highest total_value levels, best first
+        bid_level: Accumulated data at the current bid price, if traded
+        ask_level: Accumulated data at the current ask price, if traded
+        totals: Per-side sums over every level (see _summarize_levels)
+        unique_price_levels: Number of traded price levels
+        period: Description of the analyzed window (defaults to the last TRADES_TO_FETCH trades)
+        volume_walls: Output of detect_volume_walls
+    """
+    significant_levels = [_level_summary(price, data) for price, data in top_levels]
+    classified_volume = totals.buy_volume + totals.sell_volume + totals.after_hour_buy + totals.after_hour_sell
+    classified_value = (
+        totals.buy_value + totals.sell_value + totals.after_hour_buy_value + totals.after_hour_sell_value
+    )
 
     return {
         "timestamp": order_book.timestamp,
@@ -559,51 +2936,886 @@ def analyze_stock_data(symbol: str, days: int = None) -> dict:
             "bid_volume": order_book.bid_1.volume,
             "ask_price": order_book.ask_1.price,
             "ask_volume": order_book.ask_1.volume,
-            "spread": order_book.ask_1.price - order_book.bid_1.price
+            "spread": order_book.ask_1.price - order_book.bid_1.price,
+            "depth": order_book.depth.levels() if order_book.depth is not None else None
         },
         "volume_analysis": {
             "significant_levels": significant_levels,
-            "current_bid_accumulated": price_volumes.get(order_book.bid_1.price, PriceVolumeData()).model_dump(),
-            "current_ask_accumulated": price_volumes.get(order_book.ask_1.price, PriceVolumeData()).model_dump()
+            "current_bid_accumulated": (bid_level or PriceVolumeData()).model_dump(),
+            "current_ask_accumulated": (ask_level or PriceVolumeData()).model_dump(),
+            "volume_walls": volume_walls or []
         },
         "trading_summary": {
-            "period": f"last {TRADES_TO_FETCH} trades",
-            "total_trades": len(trades),
+            "period": period or f"last {TRADES_TO_FETCH} trades",
+            "total_trades": totals.total_trades,
             "volume": {
-                "buy": buy_volume,
-                "sell": sell_volume,
+                "buy": totals.buy_volume,
+                "sell": totals.sell_volume,
                 "after_hour": {
-                    "buy": after_hour_buy,
-                    "sell": after_hour_sell,
-                    "unknown": after_hour_unknown,
-                    "total": after_hour_buy + after_hour_sell + after_hour_unknown
+                    "buy": totals.after_hour_buy,
+                    "sell": totals.after_hour_sell,
+                    "unknown": totals.after_hour_unknown,
+                    "total": totals.after_hour_buy + totals.after_hour_sell + totals.after_hour_unknown
                 },
-                "total": total_volume,
-                "buy_ratio": (buy_volume + after_hour_buy) / 
-                            (buy_volume + sell_volume + after_hour_buy + after_hour_sell) 
-                            if (buy_volume + sell_volume + after_hour_buy + after_hour_sell) > 0 else 0
+                "total": totals.total_volume,
+                "buy_ratio": (totals.buy_volume + totals.after_hour_buy) / classified_volume
+                            if classified_volume > 0 else 0
             },
             "value": {
-                "buy": buy_value,
-                "sell": sell_value,
+                "buy": totals.buy_value,
+                "sell": totals.sell_value,
                 "after_hour": {
-                    "buy": after_hour_buy_value,
-                    "sell": after_hour_sell_value,
-                    "unknown": after_hour_unknown_value,
-                    "total": after_hour_buy_value + after_hour_sell_value + after_hour_unknown_value
+                    "buy": totals.after_hour_buy_value,
+                    "sell": totals.after_hour_sell_value,
+                    "unknown": totals.after_hour_unknown_value,
+                    "total": (
+                        totals.after_hour_buy_value + totals.after_hour_sell_value + totals.after_hour_unknown_value
+                    )
                 },
-                "total": total_value,
-                "buy_ratio": (buy_value + after_hour_buy_value) / 
-                            (buy_value + sell_value + after_hour_buy_value + after_hour_sell_value)
-                            if (buy_value + sell_value + after_hour_buy_value + after_hour_sell_value) > 0 else 0
+                "total": totals.total_value,
+                "buy_ratio": (totals.buy_value + totals.after_hour_buy_value) / classified_value
+                            if classified_value > 0 else 0
             },
-            "unique_price_levels": len(price_volumes),
-            "average_price": total_value / total_volume if total_volume > 0 else 0
+            "unique_price_levels": unique_price_levels,
+            "average_price": totals.total_value / totals.total_volume if totals.total_volume > 0 else 0
+        }
+    }
+
+def _analysis_from_levels(
+    symbol: str,
+    order_book: OrderBook,
+    price_volumes: Dict[float, PriceVolumeData],
+    period: Optional[str] = None
+) -> dict:
+    """Build the analyze_stock_data result from the full set of price levels"""
+    # Partial selection of the significant levels; ties keep level order
+    top_levels = heapq.nlargest(5, price_volumes.items(), key=lambda x: x[1].total_value)
+    return _build_analysis_result(
+        symbol,
+        order_book,
+        top_levels,
+        price_volumes.get(order_book.bid_1.price),
+        price_volumes.get(order_book.ask_1.price),
+        _summarize_levels(price_volumes),
+        len(price_volumes),
+        period,
+        detect_volume_walls(price_volumes, order_book.match_price, depth=order_book.depth)
+    )
+
+def _analyze_python(symbol: str, order_book: OrderBook, days: Optional[int]) -> dict:
+    """Analysis backend that streams raw trades through this process"""
+    # Analyze volumes at each price level, one cursor chunk at a time
+    accumulator = PriceLevelAccumulator(order_book)
+    batches = iter_recent_trade_batches(symbol, limit=TRADES_TO_FETCH, days=days)
+    for trades in _metrics.timed_iter("trade_cursor_drain", batches):
+        accumulator.add(trades)
+    return _analysis_from_levels(symbol, order_book, accumulator.price_volumes())
+
+def _level_group_stage(bid_price: float, ask_price: float) -> List[Dict[str, Any]]:
+    """
+    Pipeline stages grouping trades into PriceVolumeData-shaped price levels
+    
+    After-hour trades are classified against the given bid/ask exactly like
+    analyze_volume_at_price. Output documents have _id = price.
+    """
+    bucket = {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$side", "bu"]}, "then": BUCKET_BUY},
+                {"case": {"$eq": ["$side", "sd"]}, "then": BUCKET_SELL},
+                {"case": {"$gte": ["$price", ask_price]}, "then": BUCKET_AFTER_HOUR_BUY},
+                {"case": {"$lte": ["$price", bid_price]}, "then": BUCKET_AFTER_HOUR_SELL}
+            ],
+            "default": BUCKET_AFTER_HOUR_UNKNOWN
         }
     }
+    group: Dict[str, Any] = {"_id": "$price"}
+    for code, (volume_field, value_field) in enumerate(zip(BUCKET_VOLUME_FIELDS, BUCKET_VALUE_FIELDS)):
+        in_bucket = {"$eq": ["$bucket", code]}
+        group[volume_field] = {"$sum": {"$cond": [in_bucket, "$volume", 0]}}
+        group[value_field] = {"$sum": {"$cond": [in_bucket, {"$multiply": ["$price", "$volume"]}, 0]}}
+    group["total_trades"] = {"$sum": 1}
+    group["last_time"] = {"$max": "$time"}
+    group["first_time"] = {"$min": "$time"}
+    
+    return [
+        {"$project": {"_id": 0, "price": 1, "volume": 1, "time": 1, "bucket": bucket}},
+        {"$group": group},
+        {"$addFields": {
+            "total_value": {"$add": [f"${field}" for field in BUCKET_VALUE_FIELDS]}
+        }}
+    ]
+
+def _level_from_doc(doc: Dict[str, Any]) -> PriceVolumeData:
+    """PriceVolumeData from a grouped level document"""
+    data = PriceVolumeData(
+        total_trades=doc.get("total_trades", 0),
+        last_trade_time=format_trade_time(doc["last_time"]) if doc.get("last_time") is not None else None,
+        last_time=doc.get("last_time"),
+        **{field: doc.get(field, 0) for field in BUCKET_VOLUME_FIELDS + BUCKET_VALUE_FIELDS}
+    )
+    return _finalize_levels({0.0: data})[0.0]
+
+def _analyze_mongo(symbol: str, order_book: OrderBook, days: Optional[int]) -> dict:
+    """
+    Analysis backend that aggregates inside MongoDB
+    
+    Grouping, side sums and the top-5 ranking run server-side, so only
+    aggregated rows (the five significant levels, the bid/ask levels, one
+    totals document and a compact row per level for wall detection) cross
+    the network instead of up to TRADES_TO_FETCH raw trades.
+    """
+    bid_price = order_book.bid_1.price
+    ask_price = order_book.ask_1.price
+    sum_fields = BUCKET_VOLUME_FIELDS + BUCKET_VALUE_FIELDS + ("total_trades",)
+    
+    pipeline = [
+        {"$match": {"symbol": symbol, "time": {"$gte": _lookback_start(days)}}},
+        {"$sort": {"time": -1}},
+        {"$limit": TRADES_TO_FETCH},
+        *_level_group_stage(bid_price, ask_price),
+        {"$facet": {
+            # Ties keep the Python path's order: first traded level first
+            "top": [{"$sort": {"total_value": -1, "first_time": 1}}, {"$limit": 5}],
+            "quote": [{"$match": {"_id": {"$in": [bid_price, ask_price]}}}],
+            # Compact per-level rows for wall detection
+            "levels": [{"$project": {"first_time": 0, "total_value": 0}}],
+            "totals": [{"$group": {
+                "_id": None,
+                "levels": {"$sum": 1},
+                **{field: {"$sum": f"${field}"} for field in sum_fields}
+            }}]
+        }}
+    ]
+    with _metrics.span("mongo_aggregate", stage="analysis"):
+        facets = next(get_database().trades.aggregate(pipeline))
+    
+    quote = {doc["_id"]: _level_from_doc(doc) for doc in facets["quote"]}
+    totals_doc = facets["totals"][0] if facets["totals"] else {}
+    return _build_analysis_result(
+        symbol,
+        order_book,
+        [(doc["_id"], _level_from_doc(doc)) for doc in facets["top"]],
+        quote.get(bid_price),
+        quote.get(ask_price),
+        _finalize_levels({0.0: PriceVolumeData(**{field: totals_doc.get(field, 0) for field in sum_fields})})[0.0],
+        totals_doc.get("levels", 0),
+        volume_walls=detect_volume_walls(
+            {doc["_id"]: _level_from_doc(doc) for doc in facets["levels"]},
+            order_book.match_price,
+            depth=order_book.depth
+        )
+    )
+
+def _analyze_profile(symbol: str, order_book: OrderBook, days: Optional[int]) -> dict:
+    """
+    Analysis backend that reads the maintained volume profile
+    
+    Reads one document per (day, price) instead of scanning trades. Covers
+    every stored trade since the lookback start rather than the last
+    TRADES_TO_FETCH trades. After-hour volume is classified here against the
+    current bid/ask, exactly as the trade-level backends do.
+    """
+    start_day = trading_day(_lookback_start(days))
+    docs = get_database().volume_profiles.find(
+        {"symbol": symbol, "day": {"$gte": start_day}},
+        projection={"_id": 0, "symbol": 0, "day": 0}
+    )
+    
+    # Merge days into one counter row per price
+    merged: Dict[float, Dict[str, Any]] = {}
+    for doc in _metrics.timed_iter("volume_profile_cursor_drain", docs):
+        level = merged.get(doc["price"])
+        if level is None:
+            merged[doc["price"]] = doc
+            continue
+        for field in PROFILE_COUNTERS:
+            level[field] += doc[field]
+        level["first_time"] = min(level["first_time"], doc["first_time"])
+        level["last_time"] = max(level["last_time"], doc["last_time"])
+    
+    ask_price = order_book.ask_1.price
+    bid_price = order_book.bid_1.price
+    price_volumes: Dict[float, PriceVolumeData] = {}
+    # First traded level first, matching the trade-level backends' ordering
+    for level in sorted(merged.values(), key=lambda level: level["first_time"]):
+        price = level["price"]
+        if price >= ask_price:
+            after_hour_bucket = BUCKET_AFTER_HOUR_BUY
+        elif price <= bid_price:
+            after_hour_bucket = BUCKET_AFTER_HOUR_SELL
+        else:
+            after_hour_bucket = BUCKET_AFTER_HOUR_UNKNOWN
+        data = PriceVolumeData(
+            buy_volume=level["buy_volume"],
+            sell_volume=level["sell_volume"],
+            buy_value=level["buy_value"],
+            sell_value=level["sell_value"],
+            total_trades=level["total_trades"],
+            last_trade_time=format_trade_time(level["last_time"]),
+            last_time=level["last_time"]
+        )
+        setattr(data, BUCKET_VOLUME_FIELDS[after_hour_bucket], level["after_hour_volume"])
+        setattr(data, BUCKET_VALUE_FIELDS[after_hour_bucket], level["after_hour_value"])
+        price_volumes[price] = data
+    
+    return _analysis_from_levels(
+        symbol,
+        order_book,
+        _finalize_levels(price_volumes),
+        period=f"all trades since {start_day}"
+    )
+
+# Selectable implementations of analyze_stock_data
+ANALYSIS_BACKENDS = {
+    "python": _analyze_python,
+    "mongo": _analyze_mongo,
+    "profile": _analyze_profile,
+}
+
+def analyze_stock_data(symbol: str, days: int = None, backend: Optional[str] = None) -> dict:
+    """
+    Analyze stock data including volume and value analysis
+    
+    Results are served from an LRU + TTL cache (ANALYSIS_CACHE_TTL,
+    ANALYSIS_CACHE_SIZE) until new data for the symbol is stored.
+    
+    Args:
+        symbol: Stock symbol
+        days: Number of days to look back (defaults to DAYS_TO_FETCH from env)
+        backend: One of ANALYSIS_BACKENDS (defaults to ANALYSIS_BACKEND from env)
+    """
+    backend = backend or ANALYSIS_BACKEND
+    if backend not in ANALYSIS_BACKENDS:
+        raise ValueError(f"Unknown analysis backend: {backend}. Expected one of {sorted(ANALYSIS_BACKENDS)}")
+    storage = get_storage()
+    if backend not in storage.analysis_backends:
+        raise ValueError(f"The {backend} analysis backend is not available on {storage.name} storage")
+    
+    if not _analysis_cache.enabled:
+        return _analyze_uncached(symbol, days, backend)
+    
+    key = (symbol, days if days is not None else DAYS_TO_FETCH, TRADES_TO_FETCH, backend)
+    result = _analysis_cache.get(key)
+    if result is None:
+        # Capture the version first so an ingest during the analysis
+        # keeps the (possibly stale) result out of the cache
+        version = _analysis_cache.version(symbol)
+        result = _analyze_uncached(symbol, days, backend)
+        _analysis_cache.put(key, version, result)
+    return result
+
+def _analyze_uncached(symbol: str, days: Optional[int], backend: str) -> dict:
+    order_book = get_latest_order_book(symbol)
+    if not order_book:
+        raise ValueError("No order book data available")
+    
+    started = time.perf_counter()
+    with _metrics.span("analysis", backend=backend):
+        result = ANALYSIS_BACKENDS[backend](symbol, order_book, days)
+    if _metrics.enabled:
+        trades = result["trading_summary"]["total_trades"]
+        _metrics.count("analysis_trades", trades, backend=backend)
+        if trades:
+            _metrics.gauge("analysis_ms_per_1k_trades", (time.perf_counter() - started) * 1e6 / trades, backend=backend)
+    return result
+
+def _analyze_partition(symbol: str, order_book: OrderBook, trades: TradeBatch) -> dict:
+    """Analyze one symbol's trades; runs in an analyze_many worker process"""
+    accumulator = PriceLevelAccumulator(order_book)
+    accumulator.add(trades)
+    return _analysis_from_levels(symbol, order_book, accumulator.price_volumes())
+
+def analyze_many(symbols: List[str], days: int = None) -> Dict[str, dict]:
+    """
+    Analyze many symbols with one database pass
+    
+    Latest order books come from a single $sort + $group aggregation and
+    trades from a single $in query streamed in (symbol, time) order and
+    partitioned by symbol, keeping the newest TRADES_TO_FETCH per symbol.
+    Partitions are analyzed in parallel in up to ANALYSIS_WORKERS processes.
+    Cached results are reused and fresh ones are cached like
+    analyze_stock_data's python backend.
+    
+    Args:
+        symbols: Stock symbols
+        days: Number of days to look back (defaults to DAYS_TO_FETCH from env)
+        
+    Returns:
+        Dict[str, dict]: analyze_stock_data-shaped result per symbol, or
+        {"error": ...} for symbols without order book data
+    """
+    results: Dict[str, dict] = {}
+    keys = {symbol: (symbol, days if days is not None else DAYS_TO_FETCH, TRADES_TO_FETCH, "python") for symbol in symbols}
+    versions = {symbol: _analysis_cache.version(symbol) for symbol in symbols}
+    if _analysis_cache.enabled:
+        for symbol in symbols:
+            cached = _analysis_cache.get(keys[symbol])
+            if cached is not None:
+                results[symbol] = cached
+    pending = [symbol for symbol in dict.fromkeys(symbols) if symbol not in results]
+    if not pending:
+        return results
+    
+    order_books = get_latest_order_books(pending)
+    for symbol in pending:
+        if symbol not in order_books:
+            results[symbol] = {"error": "No order book data available"}
+    
+    partitions = get_storage().recent_trades_by_symbol(list(order_books), TRADES_TO_FETCH, _lookback_start(days))
+    
+    symbols_to_run = list(partitions)
+    arguments = (symbols_to_run, [order_books[s] for s in symbols_to_run], [partitions[s] for s in symbols_to_run])
+    if ANALYSIS_WORKERS > 1 and len(symbols_to_run) > 1:
+        with ProcessPoolExecutor(max_workers=min(ANALYSIS_WORKERS, len(symbols_to_run))) as executor:
+            analyzed = list(executor.map(_analyze_partition, *arguments))
+    else:
+        analyzed = list(map(_analyze_partition, *arguments))
+    
+    for symbol, result in zip(symbols_to_run, analyzed):
+        results[symbol] = result
+        if _analysis_cache.enabled:
+            _analysis_cache.put(keys[symbol], versions[symbol], result)
+    return results
+
+# Columnar export schemas. Trade sides are stored as SIDE_* codes and times
+# as epoch seconds, so files load straight into TradeBatch arrays.
+EXPORT_FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+TRADE_EXPORT_FIELDS = (
+    ("trade_id", "string"),
+    ("price", "float64"),
+    ("volume", "int64"),
+    ("side", "int8"),
+    ("time", "float64")
+)
+ORDER_BOOK_EXPORT_FIELDS = (
+    ("time", "float64"),
+    ("match_price", "float64"),
+    ("bid_price", "float64"),
+    ("bid_volume", "int64"),
+    ("ask_price", "float64"),
+    ("ask_volume", "int64"),
+    ("change_percent", "float64"),
+    ("volume", "int64")
+)
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("pyarrow is required to export to and analyze from columnar files")
+
+def _export_schema(fields: tuple) -> "pa.Schema":
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in fields])
+
+def export_path(collection_name: str, symbol: str, day: date, directory: Optional[str] = None, file_format: Optional[str] = None) -> str:
+    """
+    File holding one symbol's day of a collection
+    
+    Files are partitioned Hive-style, e.g.
+    exports/trades/day=2024-01-02/symbol=VIC/part.arrow, so pyarrow.dataset
+    and most query engines can read the tree directly.
+    """
+    file_format = file_format or EXPORT_FORMAT
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}. Expected one of {sorted(EXPORT_FORMATS)}")
+    return os.path.join(
+        directory or EXPORT_DIR,
+        collection_name,
+        f"day={day.isoformat()}",
+        f"symbol={symbol}",
+        "part" + EXPORT_FORMATS[file_format]
+    )
+
+class _ColumnarWriter:
+    """Writes record batches to an Arrow IPC or Parquet file via a temporary file"""
+    
+    def __init__(self, path: str, schema: "pa.Schema"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._partial = path + ".partial"
+        if path.endswith(EXPORT_FORMATS["parquet"]):
+            self._writer = pq.ParquetWriter(self._partial, schema)
+        else:
+            self._writer = pa.ipc.new_file(self._partial, schema)
+        self.rows = 0
+    
+    def write(self, batch: "pa.RecordBatch") -> None:
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+    
+    def close(self) -> None:
+        """Finish the file and move it into place, replacing any earlier export"""
+        self._writer.close()
+        os.replace(self._partial, self.path)
+
+def _trade_record_batch(trades: TradeBatch) -> "pa.RecordBatch":
+    return pa.RecordBatch.from_arrays(
+        [pa.array(trades.trade_ids, pa.string()), pa.array(trades.prices), pa.array(trades.volumes),
+         pa.array(trades.sides), pa.array(trades.times)],
+        schema=_export_schema(TRADE_EXPORT_FIELDS)
+    )
+
+def _export_trades_day(db, symbol: str, day: date, path: str) -> int:
+    """Write one symbol's trades for a day, newest first; returns the row count"""
+    day_start = datetime.combine(day, datetime.min.time(), tzinfo=TZINFO).timestamp()
+    cursor = db.trades.find(
+        {"symbol": symbol, "time": {"$gte": day_start, "$lt": day_start + 86400}},
+        projection={"_id": 0, **{field: 1 for field in TRADE_FIELDS}},
+        sort=[("time", -1)],
+        batch_size=TRADE_CURSOR_BATCH_SIZE
+    )
+    writer = None
+    chunk: List[Dict[str, Any]] = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) == TRADE_CURSOR_BATCH_SIZE:
+            writer = writer or _ColumnarWriter(path, _export_schema(TRADE_EXPORT_FIELDS))
+            writer.write(_trade_record_batch(TradeBatch.from_docs(symbol, chunk)))
+            chunk = []
+    if chunk:
+        writer = writer or _ColumnarWriter(path, _export_schema(TRADE_EXPORT_FIELDS))
+        writer.write(_trade_record_batch(TradeBatch.from_docs(symbol, chunk)))
+    if writer is None:
+        return 0
+    writer.close()
+    return writer.rows
+
+def _export_order_books_day(db, symbol: str, day: date, path: str) -> int:
+    """Write one symbol's order book snapshots for a day, oldest first; returns the row count"""
+    day_start = datetime.combine(day, datetime.min.time(), tzinfo=TZINFO).timestamp()
+    # Stored timestamps are ISO strings in the fetching host's local time, so
+    # select a day either side by string and cut to the TIMEZONE day exactly
+    cursor = db.order_books.find(
+        {"symbol": symbol, "timestamp": {
+            "$gte": (day - timedelta(days=1)).isoformat(),
+            "$lt": (day + timedelta(days=2)).isoformat()
+        }},
+        projection={"_id": 0},
+        sort=[("timestamp", 1)]
+    )
+    columns: Dict[str, list] = {name: [] for name, _ in ORDER_BOOK_EXPORT_FIELDS}
+    for doc in cursor:
+        taken_at = _order_book_time(doc["timestamp"]).timestamp()
+        if not day_start <= taken_at < day_start + 86400:
+            continue
+        columns["time"].append(taken_at)
+        columns["match_price"].append(doc["match_price"])
+        columns["bid_price"].append(doc["bid_1"]["price"])
+        columns["bid_volume"].append(doc["bid_1"]["volume"])
+        columns["ask_price"].append(doc["ask_1"]["price"])
+        columns["ask_volume"].append(doc["ask_1"]["volume"])
+        columns["change_percent"].append(doc["change_percent"])
+        columns["volume"].append(doc["volume"])
+    if not columns["time"]:
+        return 0
+    
+    schema = _export_schema(ORDER_BOOK_EXPORT_FIELDS)
+    writer = _ColumnarWriter(path, schema)
+    writer.write(pa.RecordBatch.from_pydict(columns, schema=schema))
+    writer.close()
+    return writer.rows
+
+def export_history(
+    symbols: List[str],
+    start_day: date,
+    end_day: Optional[date] = None,
+    directory: Optional[str] = None,
+    file_format: Optional[str] = None
+) -> Dict[str, Dict[str, int]]:
+    """
+    Export stored trades and order books to columnar files, one per symbol and day
+    
+    Each day is read with one indexed range scan per collection and streamed
+    to disk in TRADE_CURSOR_BATCH_SIZE record batches. Re-exporting a day
+    replaces its files. Days without data produce no file.
+    
+    Args:
+        symbols: Stock symbols
+        start_day: First day to export
+        end_day: Last day to export, inclusive (defaults to start_day)
+        directory: Export root (defaults to EXPORT_DIR)
+        file_format: "arrow" or "parquet" (defaults to EXPORT_FORMAT)
+        
+    Returns:
+        Dict[str, Dict[str, int]]: Rows written per symbol, keyed "trades" and "order_books"
+    """
+    _require_mongo_storage("Exporting history")
+    _require_pyarrow()
+    end_day = end_day or start_day
+    db = get_database()
+    written = {symbol: {"trades": 0, "order_books": 0} for symbol in symbols}
+    
+    day = start_day
+    while day <= end_day:
+        for symbol in symbols:
+            written[symbol]["trades"] += _export_trades_day(
+                db, symbol, day, export_path("trades", symbol, day, directory, file_format)
+            )
+            written[symbol]["order_books"] += _export_order_books_day(
+                db, symbol, day, export_path("order_books", symbol, day, directory, file_format)
+            )
+        day += timedelta(days=1)
+    return written
+
+def _open_export(path: str) -> "pa.Table":
+    """Memory-map an exported file; Arrow IPC columns are read without copying"""
+    if path.endswith(EXPORT_FORMATS["parquet"]):
+        return pq.read_table(path, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+def _find_export(collection_name: str, symbol: str, day: date, directory: Optional[str]) -> Optional[str]:
+    for file_format in EXPORT_FORMATS:
+        path = export_path(collection_name, symbol, day, directory, file_format)
+        if os.path.exists(path):
+            return path
+    return None
+
+def _array_from_column(column: "pa.ChunkedArray", typecode: str) -> array.array:
+    """Copy a null-free primitive column into an array.array with one memcpy per chunk"""
+    values = array.array(typecode)
+    for chunk in column.chunks:
+        start = chunk.offset * values.itemsize
+        values.frombytes(memoryview(chunk.buffers()[1])[start:start + len(chunk) * values.itemsize])
+    return values
+
+class _ExportedTradeIds(Sequence):
+    """
+    Lazy trade_id column of an exported file for TradeBatch.trade_ids
+    
+    Building a str per trade costs most of an exported read and the
+    analysis never looks at trade_ids, so values are converted only when
+    indexed, sliced or iterated. The first append or extend (as
+    TradeBatch.append/extend do) converts the column to a list.
+    """
+    __slots__ = ("_column", "_values")
+    
+    def __init__(self, column: "pa.ChunkedArray"):
+        self._column = column
+        self._values: Optional[List[str]] = None
+    
+    def __len__(self) -> int:
+        return len(self._column) if self._values is None else len(self._values)
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if self._values is not None:
+            return self._values[index]
+        if not isinstance(index, slice):
+            return self._column[range(len(self._column))[index]].as_py()
+        rows = range(len(self._column))[index]
+        if rows.step == 1:
+            return self._column.slice(rows.start, len(rows)).to_pylist()
+        return self._column.take(pa.array(rows, type=pa.int64())).to_pylist()
+    
+    def __iter__(self):
+        return iter(self._column.to_pylist() if self._values is None else self._values)
+    
+    def append(self, trade_id: str) -> None:
+        self._materialize().append(trade_id)
+    
+    def extend(self, trade_ids) -> None:
+        # Copy first: extending by our own iterator would never finish
+        self._materialize().extend(list(trade_ids))
+    
+    def _materialize(self) -> List[str]:
+        if self._values is None:
+            self._values = self._column.to_pylist()
+            self._column = None
+        return self._values
+
+def iter_exported_trade_batches(
+    symbol: str,
+    start_day: date,
+    end_day: Optional[date] = None,
+    directory: Optional[str] = None
+):
+    """
+    Stream exported trades as newest-first TradeBatch chunks, one per day
+    
+    Args:
+        symbol: Stock symbol
+        start_day: First day to read
+        end_day: Last day to read, inclusive (defaults to start_day)
+        directory: Export root (defaults to EXPORT_DIR)
+        
+    Yields:
+        TradeBatch: One day of trades, newest day first
+    """
+    _require_pyarrow()
+    day = end_day or start_day
+    while day >= start_day:
+        path = _find_export("trades", symbol, day, directory)
+        if path:
+            table = _open_export(path)
+            batch = TradeBatch(symbol)
+            batch.trade_ids = _ExportedTradeIds(table.column("trade_id"))
+            batch.prices = _array_from_column(table.column("price"), "d")
+            batch.volumes = _array_from_column(table.column("volume"), "q")
+            batch.sides = _array_from_column(table.column("side"), "b")
+            batch.times = _array_from_column(table.column("time"), "d")
+            yield batch
+        day -= timedelta(days=1)
+
+def get_exported_order_book(
+    symbol: str,
+    start_day: date,
+    end_day: Optional[date] = None,
+    directory: Optional[str] = None
+) -> Optional[OrderBook]:
+    """Last exported order book snapshot of a symbol within the given days"""
+    _require_pyarrow()
+    day = end_day or start_day
+    while day >= start_day:
+        path = _find_export("order_books", symbol, day, directory)
+        if path:
+            table = _open_export(path)
+            last = {name: table.column(name)[table.num_rows - 1].as_py() for name in table.column_names}
+            return OrderBook(
+                symbol=symbol,
+                timestamp=datetime.fromtimestamp(last["time"], tz=TZINFO).isoformat(),
+                match_price=last["match_price"],
+                bid_1=OrderBookLevel(price=last["bid_price"], volume=last["bid_volume"]),
+                ask_1=OrderBookLevel(price=last["ask_price"], volume=last["ask_volume"]),
+                change_percent=last["change_percent"],
+                volume=last["volume"]
+            )
+        day -= timedelta(days=1)
+    return None
+
+def analyze_exported(
+    symbol: str,
+    start_day: date,
+    end_day: Optional[date] = None,
+    directory: Optional[str] = None,
+    limit: Optional[int] = None
+) -> dict:
+    """
+    Run the volume analysis against exported files instead of MongoDB
+    
+    After-hour trades are classified against the last exported order book
+    in the range, as analyze_stock_data does with the latest stored one.
+    
+    Args:
+        symbol: Stock symbol
+        start_day: First day to analyze
+        end_day: Last day to analyze, inclusive (defaults to start_day)
+        directory: Export root (defaults to EXPORT_DIR)
+        limit: Analyze only the newest `limit` trades (defaults to all)
+        
+    Returns:
+        dict: analyze_stock_data-shaped result
+    """
+    order_book = get_exported_order_book(symbol, start_day, end_day, directory)
+    if not order_book:
+        raise ValueError("No exported order book data available")
+    
+    accumulator = PriceLevelAccumulator(order_book)
+    for trades in iter_exported_trade_batches(symbol, start_day, end_day, directory):
+        if limit is not None:
+            trades = trades[:limit - accumulator.total_trades]
+        accumulator.add(trades)
+        if limit is not None and accumulator.total_trades >= limit:
+            break
+    
+    period = f"exported trades {start_day} to {end_day or start_day}"
+    if limit is not None:
+        period = f"last {limit} {period}"
+    return _analysis_from_levels(symbol, order_book, accumulator.price_volumes(), period=period)
+
+def parse_watchlist(spec: str, default_interval: float = SCHEDULER_DEFAULT_INTERVAL) -> Dict[str, float]:
+    """
+    Parse a watchlist spec such as "VIC:5,HPG:15,FPT"
+    
+    Returns:
+        Dict[str, float]: Poll interval in seconds keyed by symbol
+    """
+    watchlist: Dict[str, float] = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        symbol, _, interval = entry.partition(":")
+        try:
+            watchlist[symbol.strip().upper()] = float(interval) if interval else default_interval
+        except ValueError:
+            raise ValueError(f"Invalid watchlist entry: {entry}. Expected 'SYMBOL' or 'SYMBOL:seconds'")
+    return watchlist
+
+class SymbolSchedule(BaseModel):
+    """Polling state and counters for one watchlist symbol"""
+    interval: float
+    runs: int = 0
+    failures: int = 0
+    coalesced_ticks: int = 0
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+    # Unjittered time.monotonic() of the current tick; jitter only offsets
+    # the heap entry, so it never carries over into the cadence
+    base: float = Field(default=0.0, exclude=True)
+
+class IngestionScheduler:
+    """
+    Long-running poller that refreshes each watchlist symbol on its own cadence
+    
+    Every symbol has exactly one pending tick and is rescheduled only when its
+    previous refresh finishes. A slow API therefore can never pile up runs
+    for the same symbol: ticks missed while it was busy are coalesced into
+    one immediate run. At most `workers` refreshes run at once; further due
+    symbols wait (backpressure) instead of queueing. Each tick is delayed by
+    a random jitter of up to `jitter` of its interval so symbols do not hit
+    the API in lockstep; ticks stay on the symbol's fixed `interval` grid,
+    so the average cadence is exactly `interval`.
+    """
+    
+    def __init__(
+        self,
+        watchlist: Dict[str, float],
+        workers: int = SCHEDULER_WORKERS,
+        jitter: float = SCHEDULER_JITTER,
+        job: Optional[Callable[[str], StoreResult]] = None
+    ):
+        self.workers = workers
+        self.jitter = jitter
+        self.job = job or fetch_and_store_stock_data
+        self.symbols = {symbol: SymbolSchedule(interval=interval) for symbol, interval in watchlist.items()}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._in_flight = 0
+        # Spread the first ticks over one jitter window
+        now = time.monotonic()
+        for state in self.symbols.values():
+            state.base = now
+        self._heap = [(now + self._jitter_for(symbol), symbol) for symbol in self.symbols]
+        heapq.heapify(self._heap)
+    
+    def _jitter_for(self, symbol: str) -> float:
+        return random.uniform(0, self.jitter * self.symbols[symbol].interval)
+    
+    def run(self) -> None:
+        """Poll until stop() is called, then wait for in-flight refreshes"""
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        try:
+            with self._cond:
+                while not self._stopping:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due, symbol = self._heap[0]
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    if self._in_flight >= self.workers:
+                        self._cond.wait()
+                        continue
+                    heapq.heappop(self._heap)
+                    self._in_flight += 1
+                    executor.submit(self._refresh, symbol)
+        finally:
+            executor.shutdown(wait=True)
+    
+    def _refresh(self, symbol: str) -> None:
+        state = self.symbols[symbol]
+        started = time.monotonic()
+        error = None
+        try:
+            result = self.job(symbol)
+            error = result.order_book.error or result.trades.error
+        except Exception as e:
+            error = str(e)
+        finished = time.monotonic()
+        
+        with self._cond:
+            state.runs += 1
+            state.last_duration = finished - started
+            state.last_error = error
+            if error:
+                state.failures += 1
+            
+            # Coalesce ticks missed while this refresh (or the queue) was slow
+            next_base = state.base + state.interval
+            if next_base < finished:
+                state.coalesced_ticks += int((finished - next_base) // state.interval) + 1
+                next_base = finished
+            state.base = next_base
+            heapq.heappush(self._heap, (next_base + self._jitter_for(symbol), symbol))
+            self._in_flight -= 1
+            self._cond.notify_all()
+    
+    def stop(self, *_) -> None:
+        """Stop scheduling new refreshes; usable as a signal handler"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+    
+    def install_signal_handlers(self) -> None:
+        """Shut down gracefully on SIGTERM and SIGINT"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-symbol run counters"""
+        with self._cond:
+            return {symbol: state.model_dump() for symbol, state in self.symbols.items()}
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = _metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args) -> None:
+        pass  # Scrapes are too frequent to log
+
+def start_metrics_server(port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Serve the metrics in Prometheus text format at /metrics on a daemon thread"""
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def run_scheduler(watchlist: Optional[Dict[str, float]] = None) -> None:
+    """
+    Run the ingestion scheduler in the foreground until SIGTERM/SIGINT
+    
+    With metrics enabled, they are served at METRICS_PORT and/or logged
+    every METRICS_LOG_INTERVAL seconds while the scheduler runs.
+    """
+    watchlist = watchlist if watchlist is not None else parse_watchlist(WATCHLIST)
+    if not watchlist:
+        raise ValueError("WATCHLIST is empty: set it to e.g. 'VIC:5,HPG:15,FPT'")
+    
+    scheduler = IngestionScheduler(watchlist)
+    scheduler.install_signal_handlers()
+    
+    server = start_metrics_server(METRICS_PORT) if _metrics.enabled and METRICS_PORT else None
+    stop_logging = threading.Event()
+    if _metrics.enabled and METRICS_LOG_INTERVAL > 0:
+        def log_metrics() -> None:
+            while not stop_logging.wait(METRICS_LOG_INTERVAL):
+                _metrics.log()
+        threading.Thread(target=log_metrics, name="metrics-log", daemon=True).start()
+    
+    try:
+        scheduler.run()
+    finally:
+        stop_logging.set()
+        if server is not None:
+            server.shutdown()
 
 if __name__ == "__main__":
-    # Test the functions
-    symbol = "VIC"
-    fetch_and_store_stock_data(symbol)
-    print(analyze_stock_data(symbol))
+    parser = argparse.ArgumentParser(description="Volume wall detector")
+    parser.add_argument("--serve", action="store_true", help="Run the ingestion scheduler for WATCHLIST")
+    args = parser.parse_args()
+    
+    if args.serve:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+        run_scheduler()
+    else:
+        # Test the functions
+        symbol = "VIC"
+        fetch_and_store_stock_data(symbol)
+        print(analyze_stock_data(symbol))